@@ -6,3 +6,14 @@ from django.apps import AppConfig
 
 class ServiceStatusConfig(AppConfig):
     name = 'service_status'
+
+    def ready(self):
+        from .checks import registry
+        from .config import conf
+
+        registry.get_plan()
+
+        if conf.SCHEDULER:
+            from .scheduler import scheduler
+
+            scheduler.start()
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import random
+import threading
+from time import monotonic
+
+from django.core.signals import setting_changed
+
+from .config import conf
+
+
+class CircuitBreaker(object):
+    """Stop running a check after `threshold` consecutive failures.
+
+    While open, the last error is returned without running the check. After a backoff (doubled on every trip, capped
+    to SERVICE_STATUS_BREAKER_MAX_BACKOFF and jittered) the breaker is half-open: a single run is let through, which
+    closes the breaker if it succeeds or opens it again if it fails.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.retry_at = None
+        self.error = None
+
+    @property
+    def retry_in(self):
+        if self.state != self.OPEN:
+            return None
+        return max(self.retry_at - monotonic(), 0)
+
+    def allow(self):
+        """Return True if the check can run."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and monotonic() >= self.retry_at:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.trips = 0
+            self.retry_at = None
+            self.error = None
+
+    def failure(self, error):
+        with self._lock:
+            self.error = error
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+                self.trips += 1
+                backoff = min(conf.BREAKER_BACKOFF * 2 ** (self.trips - 1), conf.BREAKER_MAX_BACKOFF)
+                self.retry_at = monotonic() + random.uniform(backoff / 2, backoff)
+                self.state = self.OPEN
+
+
+_lock = threading.Lock()
+breakers = {}
+
+
+def get_breaker(check):
+    """Return the CircuitBreaker of `check` (shared by all its runs), or None if disabled."""
+    if not check.breaker_threshold:
+        return None
+    with _lock:
+        breaker = breakers.get(check.name)
+        if breaker is None or breaker.threshold != check.breaker_threshold:
+            breaker = breakers[check.name] = CircuitBreaker(check.breaker_threshold)
+        return breaker
+
+
+def _handler(sender, setting, **kwargs):
+    if setting.startswith('SERVICE_STATUS'):
+        with _lock:
+            breakers.clear()
+
+
+setting_changed.connect(_handler)
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import threading
+
+from django.core.signals import setting_changed
+
+
+class ResultCache(object):
+    """In-process cache of the completed checks, keyed by check name.
+
+    A cached check is fresh for `check.ttl` seconds; after that it is still served (stale-while-revalidate)
+    while a single refresh runs in a background thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = {}
+        self._refreshing = set()
+
+    def get(self, check, refresh):
+        """Return the cached result for `check` (or None), starting `refresh(check)` in background if stale."""
+        with self._lock:
+            cached = self._results.get(check.name)
+            if cached is None or cached.__class__ is not check.__class__:
+                return None
+            if cached.age >= cached.ttl and check.name not in self._refreshing:
+                self._refreshing.add(check.name)
+                thread = threading.Thread(target=self._refresh, args=(check, refresh),
+                                          name='service-status-refresh-{}'.format(check.name))
+                thread.daemon = True
+                thread.start()
+        return cached
+
+    def set(self, check):
+        with self._lock:
+            if check.ttl:
+                self._results[check.name] = check
+            else:
+                self._results.pop(check.name, None)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def _refresh(self, check, refresh):
+        try:
+            refresh(check)
+            self.set(check)
+        finally:
+            with self._lock:
+                self._refreshing.discard(check.name)
+
+
+result_cache = ResultCache()
+
+
+def _handler(sender, setting, **kwargs):
+    if setting.startswith('SERVICE_STATUS'):
+        result_cache.clear()
+
+
+setting_changed.connect(_handler)
@@ -1,25 +1,53 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, print_function, unicode_literals
 
+import asyncio
+import copy
 import logging
 import re
+import threading
+import uuid
+import weakref
 from collections import namedtuple
+from collections.abc import Mapping
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import monotonic, time
+from urllib.parse import urlsplit
 
+from asgiref.sync import sync_to_async
 from django.apps import apps
-from six import python_2_unicode_compatible
+from django.conf import settings
+from django.core.cache import caches, close_caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, router, transaction
+from six import python_2_unicode_compatible, string_types
 from django.utils.module_loading import import_string
 
-from service_status.utils import get_user_swap, GetTime
+from service_status.utils import fan_out, get_user_swap, GetTime, HttpConnectionPool, SingleFlight
+from .breaker import get_breaker
+from .cache import result_cache
 from .config import conf
-from .exceptions import SystemStatusError, SystemStatusWarning
+from .exceptions import SystemStatusError, SystemStatusTimeout, SystemStatusWarning
+from .metrics import metrics
+from .reporting import reporter
+from .store import get_shared_store
 
 try:
     import redis
 except ImportError:
     pass
 
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
 sentry = logging.getLogger('sentry')
 
+# when (as a Unix timestamp) every check last completed without errors, by check name
+last_successes = {}
+
 
 @python_2_unicode_compatible
 class SystemCheckBase(object):
@@ -28,9 +56,31 @@ class SystemCheckBase(object):
     error = None
     warning = None
     timing = None
+    timeout = None
+    interval = None
+    tags = ()
+    depends_on = ()
+    skipped = False
+    cache_ttl = 0
+    cache_error_ttl = 0
+    started = None
+    completed = None
+    breaker_threshold = 0
+    circuit = None
+    circuit_retry_in = None
 
-    def __init__(self, name, **kwargs):
+    _result_lock = threading.Lock()
+
+    def __init__(self, name, timeout=None, cache_ttl=None, cache_error_ttl=None, interval=None,
+                 breaker_threshold=None, tags=(), depends_on=(), **kwargs):
         self.name = name
+        self.timeout = timeout
+        self.tags = tuple(tags)
+        self.depends_on = tuple(depends_on)
+        self.breaker_threshold = conf.BREAKER_THRESHOLD if breaker_threshold is None else breaker_threshold
+        self.interval = conf.SCHEDULER_INTERVAL if interval is None else interval
+        self.cache_ttl = conf.CACHE_TTL if cache_ttl is None else cache_ttl
+        self.cache_error_ttl = conf.CACHE_ERROR_TTL if cache_error_ttl is None else cache_error_ttl
 
     def __str__(self):
         return '{} {}: {} ({:.3f}s)'.format(self.__class__.__name__, self.name, self.output, self.elapsed)
@@ -38,30 +88,199 @@ class SystemCheckBase(object):
     def _run(self):
         raise NotImplementedError()  # pragma: no cover
 
+    def _complete(self, timing, output, error=None, warning=None, record=True):
+        # the result of a check that already timed out is discarded
+        with self._result_lock:
+            if isinstance(self.error, SystemStatusTimeout):
+                return False
+            self.timing = timing
+            self.output = output
+            self.error = error
+            self.warning = warning
+            self.completed = monotonic()
+            if record and error is None:
+                last_successes[self.name] = time()
+        if record:
+            self._record(error)
+        return True
+
+    def _record(self, error):
+        """Update the metrics and the circuit breaker of the check with the result of a run."""
+        metrics.observe(self.name, self.status, self.elapsed)
+        breaker = get_breaker(self)
+        if breaker is None:
+            return
+        if error is None:
+            breaker.success()
+        else:
+            breaker.failure(error)
+        self._set_circuit(breaker)
+
+    def _set_circuit(self, breaker):
+        self.circuit = None if breaker.state == breaker.CLOSED else breaker.state
+        self.circuit_retry_in = breaker.retry_in
+
+    def _short_circuit(self):
+        """Return the last error of the check if its circuit breaker is open, without logging it."""
+        breaker = get_breaker(self)
+        if breaker is None or breaker.allow():
+            return None
+        # a copy (without traceback) for every run: raising the stored error would grow its traceback with every raise
+        error = copy.copy(breaker.error)
+        timing = GetTime(self.name)
+        timing.elapsed = 0
+        self._complete(timing, str(error), error=error, record=False)
+        self._set_circuit(breaker)
+        return error
+
+    def get_fingerprint(self):
+        """The fingerprint grouping the events of the check in Sentry."""
+        return ['service-status', self.class_path, self.name]
+
+    def _report(self, log, message):
+        if reporter.should_report(self, self.status):
+            log(message, extra={'fingerprint': self.get_fingerprint()})
+
+    def _fail(self, timing, e):
+        """Record the exception raised by the check and return the one to raise."""
+        if isinstance(e, SystemStatusWarning):
+            if self._complete(timing, str(e), warning=e):
+                self._report(sentry.warning, getattr(e, 'log_message', str(e)))
+            return e
+        if isinstance(e, SystemStatusError):
+            if self._complete(timing, str(e), error=e):
+                self._report(sentry.error, getattr(e, 'log_message', str(e)))
+            return e
+        error = SystemStatusError(repr(e))
+        if self._complete(timing, str(e), error=error):
+            self._report(sentry.exception, e)
+        return error
+
+    def _succeed(self, timing, output):
+        if self._complete(timing, output):
+            self._report(sentry.info, '{}: recovered'.format(self.name))
+
     def run(self):
+        error = self._short_circuit()
+        if error is not None:
+            raise error
+        self.started = monotonic()
+        try:
+            with GetTime() as timing:
+                output = self._run() or 'OK'
+        except Exception as e:
+            raise self._fail(timing, e)
+        self._succeed(timing, output)
+
+    # checks doing I/O can implement a native `async def _arun(self)`, used by `arun()` instead of `_run()`
+    _arun = None
+
+    async def arun(self):
+        if self._arun is None:
+            # the sync-only checks run in a worker thread
+            error = await sync_to_async(run_check_in_thread, thread_sensitive=False)(self)
+            if error:
+                raise error
+            return
+
+        error = self._short_circuit()
+        if error is not None:
+            raise error
+        self.started = monotonic()
         try:
-            with GetTime() as self.timing:
-                self.output = self._run() or 'OK'
-        except SystemStatusWarning as e:
-            self.warning = e
-            self.output = str(e)
-            log_message = getattr(e, 'log_message', str(e))
-            sentry.warning(log_message)
-            raise
-        except SystemStatusError as e:
-            self.error = e
-            self.output = str(e)
-            log_message = getattr(e, 'log_message', str(e))
-            sentry.error(log_message)
-            raise
+            with GetTime() as timing:
+                output = await self._arun() or 'OK'
         except Exception as e:
-            self.error = SystemStatusError(repr(e))
-            self.output = str(e)
-            sentry.exception(e)
-            raise self.error
+            raise self._fail(timing, e)
+        self._succeed(timing, output)
+
+    def pending(self):
+        """Mark the check as not run yet."""
+        self.timing = GetTime(self.name)
+        self.timing.elapsed = 0
+        self.output = 'waiting for the first run'
+        self.error = SystemStatusError(self.output)
+
+    def expire(self):
+        """Mark the check as timed out, unless it has already completed."""
+        with self._result_lock:
+            if self.output is not None:
+                return False
+            self.timing = GetTime(self.name)
+            if self.started is None:
+                self.timing.elapsed = 0
+                self.output = 'not started before the deadline'
+            else:
+                self.timing.elapsed = monotonic() - self.started
+                self.output = 'timed out'
+            self.error = SystemStatusTimeout(self.output)
+            self.completed = monotonic()
+        if self.started is not None:
+            self._record(self.error)
+        self._report(sentry.error, '{}: {}'.format(self.name, self.output))
+        return True
+
+    def skip(self, dependency):
+        """Mark the check as skipped because the check `dependency` failed, unless it has already completed."""
+        with self._result_lock:
+            if self.output is not None:
+                return False
+            self.timing = GetTime(self.name)
+            self.timing.elapsed = 0
+            self.output = 'skipped: `{}` failed'.format(dependency)
+            self.skipped = True
+            self.completed = monotonic()
+        return True
+
+    @property
+    def failed(self):
+        """Whether the check failed (or was skipped), so that the checks depending on it are skipped."""
+        return bool(self.error) or self.skipped
+
+    @property
+    def class_path(self):
+        return '{}.{}'.format(self.__class__.__module__, self.__class__.__name__)
+
+    def serialize(self):
+        """Return the result of the check as a dict (see `restore`)."""
+        return {
+            'class': self.class_path,
+            'name': self.name,
+            'status': self.status,
+            'output': self.output,
+            'elapsed': self.elapsed,
+            'cpu_elapsed': self.cpu_elapsed,
+            'completed': time() - (monotonic() - self.completed),
+            'last_success': self.last_success,
+        }
+
+    def restore(self, data):
+        """Set the result of the check from a dict returned by `serialize` (e.g. by another process)."""
+        timing = GetTime(self.name)
+        timing.elapsed = data['elapsed']
+        timing.cpu_elapsed = data['cpu_elapsed']
+        error = warning = None
+        self.skipped = data['status'] == 'skipped'
+        if data['status'] == 'timeout':
+            error = SystemStatusTimeout(data['output'])
+        elif data['status'] == 'error':
+            error = SystemStatusError(data['output'])
+        elif data['status'] == 'warning':
+            warning = SystemStatusWarning(data['output'])
+        self._complete(timing, data['output'], error=error, warning=warning, record=False)
+        self.completed = monotonic() - max(time() - data['completed'], 0)
+        with self._result_lock:
+            if (data.get('last_success') or 0) > (self.last_success or 0):
+                last_successes[self.name] = data['last_success']
 
     @property
     def status(self):
+        if self.skipped:
+            return 'skipped'
+
+        if isinstance(self.error, SystemStatusTimeout):
+            return 'timeout'
+
         if self.error:
             return 'error'
 
@@ -72,12 +291,48 @@ class SystemCheckBase(object):
 
     @property
     def elapsed(self):
+        """The wall-clock time (in seconds) taken by the check."""
         return getattr(self.timing, 'elapsed', None)
 
+    @property
+    def cpu_elapsed(self):
+        """The CPU time (in seconds) spent by the thread that ran the check."""
+        return getattr(self.timing, 'cpu_elapsed', None)
+
+    @property
+    def last_success(self):
+        """When (as a Unix timestamp) the check last completed without errors, or None."""
+        return last_successes.get(self.name)
+
+    @property
+    def ttl(self):
+        """How long (in seconds) the result of the check can be cached."""
+        return self.cache_error_ttl if self.failed else self.cache_ttl
+
+    @property
+    def age(self):
+        """How old (in seconds) the result of a cacheable check is."""
+        if not self.ttl or self.completed is None:
+            return None
+        return monotonic() - self.completed
+
 
 class DatabaseCheck(SystemCheckBase):
+    """Query the database.
+
+    `mode` is one of:
+     - `ping`: run `SELECT 1` on `database_alias`
+     - `exists`: fetch (at most) one row of `model_name`
+     - `count`: count the rows of `model_name` (default, can be very expensive on large tables)
+
+    `statement_timeout` (in seconds) bounds the query on PostgreSQL, MySQL and MariaDB and is ignored by the other
+    backends.
+    """
     model_name = 'sessions.Session'
     database_alias = None
+    mode = 'count'
+    modes = ('ping', 'exists', 'count')
+    statement_timeout = None
 
     def __init__(self, **kwargs):
         super(DatabaseCheck, self).__init__(**kwargs)
@@ -85,19 +340,235 @@ class DatabaseCheck(SystemCheckBase):
             self.model_name = kwargs['model_name']
         if 'database_alias' in kwargs:
             self.database_alias = kwargs['database_alias']
+        if 'mode' in kwargs:
+            self.mode = kwargs['mode']
+        if 'statement_timeout' in kwargs:
+            self.statement_timeout = kwargs['statement_timeout']
+        if self.mode not in self.modes:
+            raise ImproperlyConfigured('{}: unknown DatabaseCheck mode `{}`'.format(self.name, self.mode))
 
-    def _run(self):
-        self.model = apps.get_model(self.model_name)
+    def get_statement_timeout_sql(self, connection):
+        """Return the statements setting and resetting the statement timeout, or None if not supported."""
+        if not self.statement_timeout:
+            return None
+        if connection.vendor == 'postgresql':
+            # SET LOCAL is undone by the rollback of the savepoint
+            return 'SET LOCAL statement_timeout = {:d}'.format(int(self.statement_timeout * 1000)), None
+        if connection.vendor == 'mysql' and getattr(connection, 'mysql_is_mariadb', False):
+            return ('SET SESSION max_statement_time = {:.3f}'.format(self.statement_timeout),
+                    'SET SESSION max_statement_time = DEFAULT')
+        if connection.vendor == 'mysql':
+            return ('SET SESSION max_execution_time = {:d}'.format(int(self.statement_timeout * 1000)),
+                    'SET SESSION max_execution_time = DEFAULT')
+        return None
 
-        if self.database_alias:
-            queryset = self.model.objects.using(self.database_alias).all()
-        else:
-            queryset = self.model.objects.all()
+    def _query(self, db):
+        if self.mode == 'ping':
+            connection = connections[db]
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1 FROM DUAL' if connection.vendor == 'oracle' else 'SELECT 1')
+                cursor.fetchone()
+            return 'SELECT 1 (db: {db}) OK'.format(db=db)
 
-        count = queryset.count()
+        queryset = self.model.objects.using(db).all()
+        if self.mode == 'exists':
+            queryset.exists()
+            return '{model} (db: {db}) OK'.format(model=self.model_name, db=db)
 
+        count = queryset.count()
         tpl = '{model} (db: {db}) {result} OK'
-        return tpl.format(model=self.model_name, db=queryset.db, result=count)
+        return tpl.format(model=self.model_name, db=db, result=count)
+
+    def _run(self):
+        if self.mode == 'ping':
+            db = self.database_alias or DEFAULT_DB_ALIAS
+        else:
+            self.model = apps.get_model(self.model_name)
+            db = self.database_alias or router.db_for_read(self.model)
+
+        statements = self.get_statement_timeout_sql(connections[db])
+        if not statements:
+            return self._query(db)
+
+        set_sql, reset_sql = statements
+        with transaction.atomic(using=db):
+            with connections[db].cursor() as cursor:
+                cursor.execute(set_sql)
+            try:
+                return self._query(db)
+            finally:
+                if reset_sql:
+                    with connections[db].cursor() as cursor:
+                        cursor.execute(reset_sql)
+                # the queries only read: rolling back keeps the timeout from outliving the check when the atomic
+                # block is nested in the transaction of the request (ATOMIC_REQUESTS)
+                transaction.set_rollback(True, using=db)
+
+
+class FanOutCheck(SystemCheckBase):
+    """Base class of the checks probing several services concurrently (e.g. all the databases).
+
+    `aliases` are the services to probe (all the ones of `get_all_aliases()` by default) but the `exclude` ones. Every
+    one is probed by `probe(alias)` in a thread of its own, which then runs `cleanup()`.
+    """
+    label = 'service'
+    aliases = None
+    exclude = ()
+
+    def __init__(self, **kwargs):
+        super(FanOutCheck, self).__init__(**kwargs)
+        if 'aliases' in kwargs:
+            self.aliases = kwargs['aliases']
+        if 'exclude' in kwargs:
+            self.exclude = kwargs['exclude']
+
+    def get_all_aliases(self):
+        raise NotImplementedError
+
+    def get_aliases(self):
+        aliases = self.get_all_aliases() if self.aliases is None else self.aliases
+        return [alias for alias in aliases if alias not in self.exclude]
+
+    def probe(self, alias):
+        raise NotImplementedError
+
+    def cleanup(self):
+        pass
+
+    def probe_all(self):
+        """Probe all the services and return the `(alias, result)` pairs, raise a SystemStatusError if any failed."""
+        results = fan_out(self.probe, self.get_aliases(), cleanup=self.cleanup)
+        errors = ['`{}`: {}'.format(alias, e) for alias, _, e in results if e is not None]
+        if errors:
+            raise SystemStatusError('{}(s) {}'.format(self.label, '; '.join(errors)))
+        return [(alias, result) for alias, result, _ in results]
+
+    def get_output(self, responses):
+        return 'got response from {} {}(s): {}'.format(len(responses), self.label, ', '.join(responses))
+
+
+class DatabasesCheck(FanOutCheck):
+    """Ping all the databases concurrently and report the latency (and the replication lag) of every one.
+
+    `aliases` are the databases to ping (all the configured ones by default) but the `exclude` ones. The replication
+    lag of the PostgreSQL and MySQL replicas is reported, with a warning when above `max_lag` (in seconds).
+    """
+    label = 'database'
+    max_lag = None
+
+    def __init__(self, **kwargs):
+        super(DatabasesCheck, self).__init__(**kwargs)
+        if 'max_lag' in kwargs:
+            self.max_lag = kwargs['max_lag']
+
+    def get_all_aliases(self):
+        return list(connections)
+
+    def get_replication_lag(self, connection):
+        """Return the replication lag (in seconds) of the database, or None if not a replica or not supported.
+
+        None is returned as well when the lag cannot be read (e.g. without the privileges): the database did answer.
+        """
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute('SELECT CASE WHEN pg_is_in_recovery() '
+                                   'THEN EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END')
+                    lag = cursor.fetchone()[0]
+                    return None if lag is None else float(lag)
+                if connection.vendor == 'mysql':
+                    return self._get_mysql_replication_lag(cursor)
+        except DatabaseError:
+            return None
+        return None
+
+    def _get_mysql_replication_lag(self, cursor):
+        # SHOW SLAVE STATUS is deprecated since MySQL 8.0.22 and removed in 8.4, SHOW REPLICA STATUS is missing before
+        try:
+            cursor.execute('SHOW REPLICA STATUS')
+        except DatabaseError:
+            cursor.execute('SHOW SLAVE STATUS')
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        columns = [column[0] for column in cursor.description]
+        # MariaDB kept Seconds_Behind_Master in SHOW REPLICA STATUS
+        column = 'Seconds_Behind_Source' if 'Seconds_Behind_Source' in columns else 'Seconds_Behind_Master'
+        lag = row[columns.index(column)]
+        return None if lag is None else float(lag)
+
+    def probe(self, alias):
+        connection = connections[alias]
+        with GetTime() as timing:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1 FROM DUAL' if connection.vendor == 'oracle' else 'SELECT 1')
+                cursor.fetchone()
+        return timing.elapsed, self.get_replication_lag(connection)
+
+    def cleanup(self):
+        connections.close_all()
+
+    def _run(self):
+        lagging = []
+        responses = []
+        for alias, (elapsed, lag) in self.probe_all():
+            if lag is None:
+                responses.append('{} {:.0f}ms'.format(alias, elapsed * 1000))
+            else:
+                responses.append('{} {:.0f}ms (lag: {:.1f}s)'.format(alias, elapsed * 1000, lag))
+                if self.max_lag is not None and lag > self.max_lag:
+                    lagging.append('`{}` {:.1f}s'.format(alias, lag))
+        output = self.get_output(responses)
+        if lagging:
+            e = SystemStatusWarning(output)
+            e.log_message = 'replication lag above {}s: {}'.format(self.max_lag, ', '.join(lagging))
+            raise e
+        return output
+
+
+class CacheCheck(FanOutCheck):
+    """Write, read and delete a few short-lived keys in all the caches concurrently and report their latency.
+
+    `aliases` are the caches to probe (all the configured ones by default) but the `exclude` ones. A warning is
+    reported when the round-trip of a cache takes more than `max_latency` (in seconds).
+    """
+    label = 'cache'
+    max_latency = None
+    key_prefix = 'service_status:probe'
+
+    def __init__(self, **kwargs):
+        super(CacheCheck, self).__init__(**kwargs)
+        if 'max_latency' in kwargs:
+            self.max_latency = kwargs['max_latency']
+
+    def get_all_aliases(self):
+        return list(settings.CACHES)
+
+    def probe(self, alias):
+        cache = caches[alias]
+        token = uuid.uuid4().hex
+        data = {'{}:{}:{}'.format(self.key_prefix, token, i): i for i in range(2)}
+        with GetTime() as timing:
+            cache.set_many(data, timeout=10)
+            values = cache.get_many(list(data))
+            cache.delete_many(list(data))
+        if values != data:
+            raise SystemStatusError('read {} of the {} keys written'.format(len(values), len(data)))
+        return timing.elapsed
+
+    def cleanup(self):
+        close_caches()
+
+    def _run(self):
+        results = self.probe_all()
+        output = self.get_output(['{} {:.0f}ms'.format(alias, elapsed * 1000) for alias, elapsed in results])
+        slow = ['`{}` {:.0f}ms'.format(alias, elapsed * 1000) for alias, elapsed in results
+                if self.max_latency is not None and elapsed > self.max_latency]
+        if slow:
+            e = SystemStatusWarning(output)
+            e.log_message = 'cache latency above {}s: {}'.format(self.max_latency, ', '.join(slow))
+            raise e
+        return output
 
 
 # class SupervisorCheck(SystemCheckBase):
@@ -146,73 +617,614 @@ class SwapCheck(SystemCheckBase):
 
 
 class CeleryCheck(SystemCheckBase):
+    ping_timeout = 1.0
+    latencies = None
+
     def __init__(self, name, **kwargs):
         super(CeleryCheck, self).__init__(name, **kwargs)
         if 'celery_app_fqn' in kwargs:
             self.celery_app_fqn = kwargs['celery_app_fqn']
         if 'worker_names' in kwargs:
             self.worker_names = kwargs['worker_names']
+        if 'ping_timeout' in kwargs:
+            self.ping_timeout = kwargs['ping_timeout']
+
+    def get_ping_timeout(self):
+        # leave the check the time to report the missing workers before its own timeout expires
+        if self.timeout:
+            return min(self.ping_timeout, self.timeout * 0.9)
+        return self.ping_timeout
 
     def _run(self):
         celery_app = import_string(self.celery_app_fqn)
-        for name in self.worker_names:
-            response = celery_app.control.ping([name])
+        worker_names = list(self.worker_names)
+        replies = {}
+        latencies = {}
+        started = monotonic()
+
+        def on_reply(reply):
+            for name in reply:
+                latencies[name] = monotonic() - started
+
+        # a single broadcast to all the workers, the replies are collected in the same window
+        for reply in celery_app.control.ping(destination=worker_names, timeout=self.get_ping_timeout(),
+                                             limit=len(worker_names), callback=on_reply) or []:
+            replies.update(reply)
+        self.latencies = latencies
+
+        not_found = [name for name in worker_names if name not in replies]
+        failed = [name for name in worker_names if name in replies and replies[name] != {'ok': 'pong'}]
+        problems = []
+        if not_found:
+            problems.append('celery worker(s) {} not found'.format(', '.join('`{}`'.format(n) for n in not_found)))
+        if failed:
+            problems.append('celery worker(s) {} did not respond'.format(', '.join('`{}`'.format(n) for n in failed)))
+        if problems:
+            raise SystemStatusError('; '.join(problems))
+
+        return 'got response from {workers} worker(s): {latencies}'.format(
+            workers=len(worker_names),
+            latencies=', '.join('{} {:.0f}ms'.format(name, latencies[name] * 1000) for name in worker_names),
+        )
+
+
+redis_clients = {}
+redis_clients_lock = threading.Lock()
 
-            if not response:
-                raise SystemStatusError('celery worker `{}` was not found'.format(name))
 
-            if response[0][name] != {'ok': 'pong'}:
-                raise SystemStatusError('celery worker `{}` did not respond'.format(name))
+def get_redis_client(redis_url, socket_timeout):
+    """Return a Redis client for `redis_url`, reused across the checks along with its connection pool."""
+    key = (redis_url, socket_timeout)
+    client = redis_clients.get(key)
+    if client is None:
+        with redis_clients_lock:
+            client = redis_clients.get(key)
+            if client is None:
+                client = redis.StrictRedis.from_url(redis_url, socket_timeout=socket_timeout,
+                                                    socket_connect_timeout=socket_timeout)
+                redis_clients[key] = client
+    return client
 
-        return 'got response from {workers} worker(s)'.format(workers=len(self.worker_names))
+
+# the asyncio clients are bound to the event loop that created them
+async_redis_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis_client(redis_url, socket_timeout):
+    """Same as `get_redis_client`, for the asyncio client of the running event loop."""
+    clients = async_redis_clients.setdefault(asyncio.get_running_loop(), {})
+    key = (redis_url, socket_timeout)
+    if key not in clients:
+        clients[key] = aioredis.StrictRedis.from_url(redis_url, socket_timeout=socket_timeout,
+                                                     socket_connect_timeout=socket_timeout)
+    return clients[key]
 
 
 class RedisCheck(SystemCheckBase):
+    """Ping Redis.
+
+    `info_fields` are the fields of the `INFO` command reported along with the outcome of the check,
+    fetched in the same round-trip of the `PING` command.
+    """
+    info_fields = ()
+
     def __init__(self, **kwargs):
         super(RedisCheck, self).__init__(**kwargs)
         if 'redis_url' in kwargs:
             self.redis_url = kwargs['redis_url']
+        if 'info_fields' in kwargs:
+            self.info_fields = kwargs['info_fields']
 
-    def get_redis_url(self):
-        regex = r'redis:\/\/(?P<host>\w+):(?P<port>\d{4})\/(?P<db>\d+)'
-        m = re.match(regex, self.redis_url)
-        return m.groupdict()
+    def get_output(self, info=None):
+        if self.info_fields:
+            return 'active ({})'.format(', '.join('{}: {}'.format(field, info.get(field))
+                                                  for field in self.info_fields))
+        return 'active'
 
     def _run(self):
-        redis_url = self.get_redis_url()
+        info = None
         try:
-            redis_con = redis.StrictRedis(
-                host=redis_url['host'],
-                port=redis_url['port'],
-                db=redis_url['db'],
-                socket_timeout=0.1,
-            )
-            redis_con.ping()
+            redis_con = get_redis_client(self.redis_url, self.timeout or 0.1)
+            if self.info_fields:
+                pipeline = redis_con.pipeline(transaction=False)
+                pipeline.ping()
+                pipeline.info()
+                _, info = pipeline.execute()
+            else:
+                redis_con.ping()
         except NameError:
             raise SystemStatusError('cannot import redis library')
-        except redis.connection.ConnectionError:
+        except (redis.connection.ConnectionError, redis.exceptions.TimeoutError):
             raise SystemStatusError('unable to connect')
-        return 'active'
+        return self.get_output(info)
+
+    async def _arun(self):
+        if aioredis is None:
+            # the redis library is missing or too old to have the asyncio client
+            return await sync_to_async(self._run, thread_sensitive=False)()
+
+        info = None
+        try:
+            redis_con = get_async_redis_client(self.redis_url, self.timeout or 0.1)
+            if self.info_fields:
+                pipeline = redis_con.pipeline(transaction=False)
+                pipeline.ping()
+                pipeline.info()
+                _, info = await pipeline.execute()
+            else:
+                await redis_con.ping()
+        except (redis.connection.ConnectionError, redis.exceptions.TimeoutError):
+            raise SystemStatusError('unable to connect')
+        return self.get_output(info)
+
+
+http_pool = HttpConnectionPool()
+
+
+class HttpCheck(SystemCheckBase):
+    """Request all the `urls` concurrently and report the latency of every one.
+
+    Every target is a URL or a dict with the `url` and, optionally, the expected `status` (`expected_status` by
+    default), a regular expression to `match` in the body and the `timeout` of the request (`request_timeout` by
+    default). The keep-alive connections are reused across the checks.
+    """
+    urls = ()
+    method = 'GET'
+    expected_status = 200
+    request_timeout = 5.0
+    headers = {'User-Agent': 'django-service-status'}
+
+    def __init__(self, **kwargs):
+        super(HttpCheck, self).__init__(**kwargs)
+        if 'urls' in kwargs:
+            self.urls = kwargs['urls']
+        if 'expected_status' in kwargs:
+            self.expected_status = kwargs['expected_status']
+        if 'request_timeout' in kwargs:
+            self.request_timeout = kwargs['request_timeout']
+        self.targets = [self.get_target(target) for target in self.urls]
+
+    def get_target(self, target):
+        if isinstance(target, string_types):
+            target = {'url': target}
+        if 'url' not in target:
+            raise ImproperlyConfigured('{}: every target of HttpCheck needs an `url`'.format(self.name))
+        parts = urlsplit(target['url'])
+        if parts.scheme not in ('http', 'https') or not parts.netloc:
+            raise ImproperlyConfigured('{}: `{}` is not an absolute http(s) URL'.format(self.name, target['url']))
+        return dict({'status': self.expected_status, 'match': None, 'timeout': self.request_timeout}, **target)
+
+    def _request(self, target):
+        with GetTime() as timing:
+            response, body = http_pool.request(self.method, target['url'], target['timeout'], headers=self.headers)
+        if response.status != target['status']:
+            raise SystemStatusError('status {} (expected {})'.format(response.status, target['status']))
+        if target['match'] and not re.search(target['match'], body.decode('utf-8', 'replace')):
+            raise SystemStatusError('the response does not match `{}`'.format(target['match']))
+        return timing.elapsed
+
+    def _run(self):
+        results = fan_out(self._request, self.targets)
+
+        errors = ['`{}`: {}'.format(target['url'], e) for target, _, e in results if e is not None]
+        if errors:
+            raise SystemStatusError('url(s) {}'.format('; '.join(errors)))
+        return 'got response from {} url(s): {}'.format(len(results), ', '.join(
+            '{} {:.0f}ms'.format(target['url'], elapsed * 1000) for target, elapsed, _ in results))
+
+
+SystemErrors = namedtuple('SystemErrors', ('checks', 'errors', 'warnings'))
+
+
+def run_check(check):
+    """Run `check` and return the SystemStatusError/SystemStatusWarning it raised, if any.
+
+    With SERVICE_STATUS_SHARED_CACHE configured, the result shared by another process may be used instead.
+    """
+    shared_store = get_shared_store()
+    try:
+        if shared_store is not None and check.cache_ttl:
+            shared_store.run(check)
+            return check.error or check.warning
+        check.run()
+    except (SystemStatusError, SystemStatusWarning) as e:
+        return e
+
+
+def run_check_in_thread(check):
+    """Same as `run_check` but closes the database connections opened by the current (worker) thread."""
+    try:
+        return run_check(check)
+    finally:
+        connections.close_all()
+
+
+def get_failed_dependency(check, results):
+    """Return the name of the first dependency of `check` that failed, according to the `results` by name."""
+    for name in check.depends_on:
+        result = results.get(name)
+        if result is not None and result.failed:
+            return name
+    return None
+
+
+def iter_checks(checks, concurrent=None, done=(), max_workers=None, deadline=None):
+    """Run the `checks` and yield each of them as soon as it completes or runs out of time.
+
+    The checks run on up to `max_workers` (SERVICE_STATUS_MAX_WORKERS by default) worker threads when `concurrent`
+    (SERVICE_STATUS_CONCURRENT by default) is enabled or when a deadline or a timeout is configured; a check that
+    misses its timeout (or the `deadline`, SERVICE_STATUS_DEADLINE by default) is marked as timed out and yielded
+    without waiting for its thread.
+
+    A check starts after the checks it depends on (`depends_on`), and is skipped if any of them failed; `done` are
+    the checks already completed (e.g. cached). The dependencies that are not run nor done are ignored.
+    """
+    deadline = conf.DEADLINE if deadline is None else deadline
+    deadline = None if deadline is None else monotonic() + deadline
+    concurrent = conf.CONCURRENT if concurrent is None else concurrent
+    max_workers = conf.MAX_WORKERS if max_workers is None else max_workers
+    if max_workers < 1:
+        raise ImproperlyConfigured('{}_MAX_WORKERS must be at least 1, not {}'.format(conf.prefix, max_workers))
+    results = dict((check.name, check) for check in done)
+    pending = set(check.name for check in checks)
+
+    def is_ready(check):
+        return not any(name in pending for name in check.depends_on)
+
+    def complete(check):
+        pending.discard(check.name)
+        results[check.name] = check
+        return check
+
+    def skip_failed(queued):
+        # the checks depending on a failed check are skipped (without waiting for their other dependencies), then
+        # the ones depending on them
+        skipped = []
+        for check in list(queued):
+            dependency = get_failed_dependency(check, results)
+            if dependency is not None:
+                queued.remove(check)
+                check.skip(dependency)
+                skipped.append(complete(check))
+        return skipped + skip_failed(queued) if skipped else []
+
+    queued = list(checks)
+    if not (concurrent or deadline is not None or any(check.timeout for check in checks)):
+        while queued:
+            for check in skip_failed(queued):
+                yield check
+            if queued:
+                # with no check ready (i.e. circular dependencies) the first one runs anyway
+                check = next((check for check in queued if is_ready(check)), queued[0])
+                queued.remove(check)
+                run_check(check)
+                yield complete(check)
+        return
+
+    workers = min(max_workers, len(checks)) if concurrent else 1
+    running = {}
+    # a timed out check keeps its thread busy: the pool is sized so that the next checks still get one
+    executor = ThreadPoolExecutor(max_workers=max(len(checks), 1))
+    try:
+        while queued or running:
+            for check in skip_failed(queued):
+                yield check
+            while queued and len(running) < workers:
+                check = next((check for check in queued if is_ready(check)), None if running else queued[0])
+                if check is None:
+                    break
+                queued.remove(check)
+                running[executor.submit(run_check_in_thread, check)] = check
+            if not running:
+                continue
+
+            now = monotonic()
+            if deadline is not None and deadline <= now:
+                for check in list(running.values()) + queued:
+                    check.expire()
+                    yield check
+                running.clear()
+                return
+
+            expiries = [] if deadline is None else [deadline]
+            expired = False
+            for future, check in list(running.items()):
+                if not check.timeout:
+                    continue
+                expiry = (now if check.started is None else check.started) + check.timeout
+                if expiry <= now:
+                    del running[future]
+                    check.expire()
+                    expired = True
+                    yield complete(check)
+                else:
+                    expiries.append(expiry)
+            if expired:
+                continue
+
+            timeout = min(expiries) - now if expiries else None
+            finished, _ = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in finished:
+                yield complete(running.pop(future))
+    finally:
+        for future in running:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+def refresh_check(check):
+    """Run `check` in a background thread, honoring its timeout."""
+    try:
+        for _ in iter_checks([check]):
+            pass
+    finally:
+        connections.close_all()
+
+
+class CheckRegistry(object):
+    """The configured checks, compiled once and rebuilt when the SERVICE_STATUS settings change.
 
+    The plan holds a configured (never run) prototype of every check: each evaluation runs shallow copies of them,
+    so importing the classes and reading and validating the init kwargs does not happen on every request.
+    The checks of every profile (SERVICE_STATUS_PROFILES) are selected once, too.
+    """
 
-def do_check():
-    checks = []
-    errors = []
-    warnings = []
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._plans = None
+        setting_changed.connect(self._handler)
 
-    for check_name, check_fqn in conf.CHECKS:
+    def _handler(self, sender, setting, **kwargs):
+        if setting.startswith(conf.prefix):
+            self.invalidate()
+
+    def invalidate(self):
+        self._plans = None
+
+    def get_plan(self, profile=None):
+        """Return the SystemErrors of the prototypes of the checks of `profile` (all the checks if None).
+
+        Raise KeyError if `profile` is not configured.
+        """
+        plans = self._plans
+        if plans is None:
+            with self._lock:
+                if self._plans is None:
+                    self._plans = self.compile()
+                plans = self._plans
+        return plans[profile]
+
+    def compile(self):
+        """Return a dict of the SystemErrors of every profile, keyed by profile name (None for all the checks)."""
+        entries = []
+        dependencies = {}
+
+        for check_name, check_fqn in conf.CHECKS:
+            try:
+                check_class = import_string(check_fqn)
+            except ImportError as e:
+                raise ImproperlyConfigured('{}: cannot import `{}`: {}'.format(check_name, check_fqn, e))
+            check_init_kwargs = getattr(conf, 'INIT_{}'.format(check_name), {})
+            if not isinstance(check_init_kwargs, Mapping):
+                raise ImproperlyConfigured('{}: {}_INIT_{} must be a dict'.format(check_name, conf.prefix, check_name))
+            tags = check_init_kwargs.get('tags', ())
+            if isinstance(tags, string_types):
+                raise ImproperlyConfigured('{}: `tags` must be a list'.format(check_name))
+            selectors = {check_name}.union(tags)
+            dependencies[check_name] = check_init_kwargs.get('depends_on', ())
+            if isinstance(dependencies[check_name], string_types):
+                raise ImproperlyConfigured('{}: `depends_on` must be a list'.format(check_name))
+            entries.append((selectors, self._create(check_class, check_name, check_init_kwargs)))
+
+        self._check_dependencies(dependencies)
+        if not isinstance(conf.PROFILES, Mapping):
+            raise ImproperlyConfigured('{}_PROFILES must be a dict'.format(conf.prefix))
+        plans = {None: self._select(entries)}
+        for profile, selectors in conf.PROFILES.items():
+            if isinstance(selectors, string_types):
+                raise ImproperlyConfigured('{}_PROFILES: `{}` must be a list of tags'.format(conf.prefix, profile))
+            selectors = set(selectors)
+            plans[profile] = self._select([entry for entry in entries if entry[0] & selectors])
+        return plans
+
+    def _check_dependencies(self, dependencies):
+        for check_name, names in dependencies.items():
+            for name in names:
+                if name not in dependencies:
+                    raise ImproperlyConfigured('{}: unknown dependency `{}`'.format(check_name, name))
+
+        # depth-first search visiting every check once: `path` holds the checks being visited, `done` the others
+        done = set()
+
+        def visit(path):
+            for name in dependencies[path[-1]]:
+                if name in path:
+                    cycle = path[path.index(name):] + [name]
+                    raise ImproperlyConfigured('circular dependency: {}'.format(' -> '.join(cycle)))
+                if name not in done:
+                    visit(path + [name])
+            done.add(path[-1])
+
+        for check_name in dependencies:
+            if check_name not in done:
+                visit([check_name])
+
+    def _create(self, check_class, check_name, check_init_kwargs):
         try:
-            check_class = import_string(check_fqn)
-            check_init_kwargs = {'name': check_name}
-            check_setting_name = 'INIT_{}'.format(check_name)
-            if hasattr(conf, check_setting_name):
-                check_init_kwargs.update(getattr(conf, check_setting_name))
-            check = check_class(**check_init_kwargs)
-            checks.append(check)
-            check.run()
-        except SystemStatusError as e:
-            errors.append(e)
-        except SystemStatusWarning as e:
-            warnings.append(e)
-
-    return namedtuple('SystemErrors', ('checks', 'errors', 'warnings'))(checks, errors, warnings)
+            check = check_class(name=check_name, **check_init_kwargs)
+        except (SystemStatusError, SystemStatusWarning) as e:
+            # the errors/warnings raised creating the check are reported in place of its result
+            return e
+        check._init_kwargs = check_init_kwargs
+        return check
+
+    def _select(self, entries):
+        checks = []
+        errors = []
+        warnings = []
+        for _, entry in entries:
+            if isinstance(entry, SystemStatusError):
+                errors.append(entry)
+            elif isinstance(entry, SystemStatusWarning):
+                warnings.append(entry)
+            else:
+                checks.append(entry)
+        return SystemErrors(tuple(checks), tuple(errors), tuple(warnings))
+
+    def get_checks(self, profile=None):
+        """Return a SystemErrors with new instances of the checks and the errors/warnings raised creating them.
+
+        The checks are created from their validated init kwargs, so that no state is shared between the callers.
+        """
+        plan = self.get_plan(profile)
+        checks, errors, warnings = self._select(
+            [(None, self._create(check.__class__, check.name, check._init_kwargs)) for check in plan.checks])
+        return SystemErrors(list(checks), list(plan.errors + errors), list(plan.warnings + warnings))
+
+
+registry = CheckRegistry()
+
+
+def get_checks(profile=None):
+    """Return a SystemErrors with new instances of the configured checks (see `CheckRegistry.get_checks`)."""
+    return registry.get_checks(profile)
+
+
+def collect_status(checks, errors=(), warnings=()):
+    """Return the SystemErrors of the completed `checks`."""
+    errors = list(errors)
+    warnings = list(warnings)
+    for check in checks:
+        if check.error:
+            errors.append(check.error)
+        elif check.warning:
+            warnings.append(check.warning)
+    return SystemErrors(checks, errors, warnings)
+
+
+async def async_run_check(check):
+    """Same as `run_check`, on the event loop and honoring the timeout of the check."""
+    if get_shared_store() is not None and check.cache_ttl:
+        # the shared store is synchronous
+        coro = sync_to_async(run_check_in_thread, thread_sensitive=False)(check)
+    else:
+        coro = check.arun()
+    try:
+        if check.timeout:
+            return await asyncio.wait_for(coro, check.timeout)
+        return await coro
+    except asyncio.TimeoutError:
+        check.expire()
+        return check.error
+    except (SystemStatusError, SystemStatusWarning) as e:
+        return e
+
+
+async def async_run_checks(checks, done=()):
+    """Run all the `checks` concurrently on the event loop, within SERVICE_STATUS_DEADLINE.
+
+    As in `iter_checks`, a check starts after the checks it depends on and is skipped if any of them failed.
+    """
+    results = dict((check.name, check) for check in done)
+    tasks = {}
+
+    async def run_after_dependencies(check):
+        upstream = [tasks[name] for name in check.depends_on if name in tasks]
+        dependency = get_failed_dependency(check, results)
+        # the check is skipped as soon as a dependency fails, without waiting for the others
+        while upstream and dependency is None:
+            _, upstream = await asyncio.wait(upstream, return_when=asyncio.FIRST_COMPLETED)
+            dependency = get_failed_dependency(check, results)
+        if dependency is not None:
+            check.skip(dependency)
+        else:
+            await async_run_check(check)
+        results[check.name] = check
+
+    # circular dependencies are not waited for
+    for check in sort_checks(checks):
+        tasks[check.name] = asyncio.ensure_future(run_after_dependencies(check))
+    if not tasks:
+        return
+    _, pending = await asyncio.wait(list(tasks.values()), timeout=conf.DEADLINE)
+    for task in pending:
+        task.cancel()
+    for check in checks:
+        check.expire()
+
+
+def sort_checks(checks):
+    """Return the `checks` sorted so that every check comes after the checks it depends on (when possible)."""
+    checks = list(checks)
+    pending = set(check.name for check in checks)
+    ordered = []
+    while checks:
+        check = next((check for check in checks if not pending.intersection(check.depends_on)), checks[0])
+        checks.remove(check)
+        pending.discard(check.name)
+        ordered.append(check)
+    return ordered
+
+
+single_flight = SingleFlight()
+
+
+def do_check(profile=None, concurrent=None, max_workers=None, deadline=None):
+    """Run the configured checks (of `profile`, if given) and return a SystemErrors.
+
+    `concurrent`, `max_workers` and `deadline` override the settings of the same name (see `iter_checks`).
+    With SERVICE_STATUS_COALESCE enabled, the concurrent callers share the same evaluation.
+    """
+    if conf.COALESCE:
+        return single_flight.do(('do_check', profile, concurrent, max_workers, deadline), _do_check,
+                                profile, concurrent, max_workers, deadline)
+    return _do_check(profile, concurrent, max_workers, deadline)
+
+
+def _do_check(profile=None, concurrent=None, max_workers=None, deadline=None):
+    checks, errors, warnings = get_checks(profile)
+
+    # the checks with a cached result are served from the cache, the others are run now
+    cached = [result_cache.get(check, refresh=refresh_check) for check in checks]
+    done = [result for result in cached if result is not None]
+    to_run = [check for check, result in zip(checks, cached) if result is None]
+    for check in iter_checks(to_run, concurrent, done, max_workers, deadline):
+        result_cache.set(check)
+    checks = [result or check for check, result in zip(checks, cached)]
+
+    return collect_status(checks, errors, warnings)
+
+
+def iter_results(checks, concurrent=None):
+    """Same as `_do_check` for the given `checks`, yielding every result as soon as it is available.
+
+    The cached results come first, then the other checks as they complete (see `iter_checks`).
+    """
+    cached = [result_cache.get(check, refresh=refresh_check) for check in checks]
+    done = [result for result in cached if result is not None]
+    for result in done:
+        yield result
+    to_run = [check for check, result in zip(checks, cached) if result is None]
+    for check in iter_checks(to_run, concurrent, done=done):
+        result_cache.set(check)
+        yield check
+
+
+async def async_do_check(profile=None):
+    """Same as `do_check`, running the checks on the event loop."""
+    if conf.COALESCE:
+        return await single_flight.ado(('do_check', profile), _async_do_check, profile)
+    return await _async_do_check(profile)
+
+
+async def _async_do_check(profile=None):
+    checks, errors, warnings = get_checks(profile)
+
+    cached = [result_cache.get(check, refresh=refresh_check) for check in checks]
+    to_run = [check for check, result in zip(checks, cached) if result is None]
+    await async_run_checks(to_run, done=[result for result in cached if result is not None])
+    for check in to_run:
+        result_cache.set(check)
+    checks = [result or check for check, result in zip(checks, cached)]
+
+    return collect_status(checks, errors, warnings)
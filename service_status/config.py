@@ -16,6 +16,22 @@ class ApplicationSettings(AppSettings):
         'INIT_SWAP': {
             'limit': 0,
         },
+        'PROFILES': {},
+        'CONCURRENT': False,
+        'MAX_WORKERS': 4,
+        'DEADLINE': None,
+        'COALESCE': True,
+        'CACHE_TTL': 0,
+        'CACHE_ERROR_TTL': 0,
+        'SCHEDULER': False,
+        'SCHEDULER_INTERVAL': 30,
+        'SHARED_CACHE': None,
+        'SHARED_CACHE_LEASE': 60,
+        'BREAKER_THRESHOLD': 0,
+        'BREAKER_BACKOFF': 5,
+        'BREAKER_MAX_BACKOFF': 300,
+        'REPORT_TRANSITIONS': False,
+        'REPORT_INTERVAL': 3600,
     }
 
 
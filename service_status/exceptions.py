@@ -8,3 +8,7 @@ class SystemStatusError(Exception):
 
 class SystemStatusWarning(Exception):
     pass
+
+
+class SystemStatusTimeout(SystemStatusError):
+    pass
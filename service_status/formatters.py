@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import json
+
+from .metrics import STATUSES as RUN_STATUSES
+from .metrics import metrics
+
+STATUSES = RUN_STATUSES + ('skipped',)
+
+
+def get_response_tag(status):
+    return 'ERRORS_FOUND' if status.errors else 'SERVICE_OPERATIONAL'
+
+
+def check_to_dict(check):
+    """Return the result of `check` as a dict."""
+    return {
+        'name': check.name,
+        'class': check.class_path,
+        'status': check.status,
+        'output': check.output,
+        'elapsed': check.elapsed,
+        'cpu_elapsed': check.cpu_elapsed,
+        'last_success': check.last_success,
+    }
+
+
+def summary_to_dict(status):
+    """Return the overall status and the errors/warnings of the SystemErrors `status` as a dict."""
+    return {
+        'status': get_response_tag(status),
+        'errors': [str(e) for e in status.errors],
+        'warnings': [str(e) for e in status.warnings],
+    }
+
+
+def to_dict(status):
+    """Return the SystemErrors `status` as a dict."""
+    data = summary_to_dict(status)
+    data['checks'] = [check_to_dict(check) for check in status.checks]
+    return data
+
+
+def dumps(data):
+    return json.dumps(data, separators=(',', ':'))
+
+
+def to_json(status):
+    """Return the SystemErrors `status` as compact JSON."""
+    return dumps(to_dict(status))
+
+
+def to_ndjson_record(record_type, data):
+    """Return a line of newline delimited JSON, for the streaming view."""
+    return dumps(dict(data, type=record_type)) + '\n'
+
+
+def to_sse_event(record_type, data):
+    """Return a server-sent event, for the streaming view."""
+    return 'event: {}\ndata: {}\n\n'.format(record_type, dumps(data))
+
+
+def to_text(status):
+    """Return the SystemErrors `status` as plain text, one line per check (as in the status page)."""
+    lines = [get_response_tag(status)]
+    lines.extend(str(check) for check in status.checks)
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _sample(metric, labels, value):
+    labels = ','.join('{}="{}"'.format(name, _escape(label)) for name, label in labels)
+    if not labels:
+        return '{} {!r}'.format(metric, float(value))
+    return '{}{{{}}} {!r}'.format(metric, labels, float(value))
+
+
+def _histograms():
+    lines = [
+        '# HELP service_status_check_duration_seconds The duration of the runs of the check.',
+        '# TYPE service_status_check_duration_seconds histogram',
+    ]
+    runs = []
+    for name in metrics.names():
+        data = metrics.get(name)
+        for upper_bound, count in data['buckets']:
+            le = '+Inf' if upper_bound == float('inf') else repr(upper_bound)
+            lines.append(_sample('service_status_check_duration_seconds_bucket', (('check', name), ('le', le)), count))
+        lines.append(_sample('service_status_check_duration_seconds_sum', (('check', name),), data['sum']))
+        lines.append(_sample('service_status_check_duration_seconds_count', (('check', name),), data['count']))
+        for status, count in sorted(data['statuses'].items()):
+            runs.append(_sample('service_status_check_runs_total', (('check', name), ('status', status)), count))
+    lines.extend([
+        '# HELP service_status_check_runs_total The runs of the check, by status.',
+        '# TYPE service_status_check_runs_total counter',
+    ])
+    return lines + runs
+
+
+def to_prometheus(status):
+    """Return the SystemErrors `status` in the Prometheus text exposition format.
+
+    The latency histograms and the run counters cover all the runs of the checks in the current process.
+    """
+    lines = [
+        '# HELP service_status_up Whether all the checks are operational.',
+        '# TYPE service_status_up gauge',
+        _sample('service_status_up', (), not status.errors),
+        '# HELP service_status_check_status The status of the check.',
+        '# TYPE service_status_check_status gauge',
+    ]
+    for check in status.checks:
+        for name in STATUSES:
+            lines.append(_sample('service_status_check_status', (('check', check.name), ('status', name)),
+                                 check.status == name))
+    lines.extend([
+        '# HELP service_status_check_elapsed_seconds The duration of the last run of the check.',
+        '# TYPE service_status_check_elapsed_seconds gauge',
+    ])
+    for check in status.checks:
+        if check.elapsed is not None:
+            lines.append(_sample('service_status_check_elapsed_seconds', (('check', check.name),), check.elapsed))
+    lines.extend([
+        '# HELP service_status_check_last_success_timestamp_seconds When the check last completed without errors.',
+        '# TYPE service_status_check_last_success_timestamp_seconds gauge',
+    ])
+    for check in status.checks:
+        if check.last_success is not None:
+            lines.append(_sample('service_status_check_last_success_timestamp_seconds', (('check', check.name),),
+                                 check.last_success))
+    lines.extend(_histograms())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import argparse
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...checks import do_check
+from ...config import conf
+from ...formatters import to_json, to_prometheus, to_text
+
+FORMATTERS = {
+    'json': to_json,
+    'text': to_text,
+    'prom': to_prometheus,
+}
+
+EXIT_OK = 0
+EXIT_WARNING = 1
+EXIT_ERROR = 2
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError('must be at least 1, not {}'.format(value))
+    return number
+
+
+class Command(BaseCommand):
+    help = 'Run the checks and print the status. Exit with 1 on warnings and with 2 on errors.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profile', help='run only the checks of this profile (SERVICE_STATUS_PROFILES)')
+        parser.add_argument('--parallel', type=positive_int, metavar='N',
+                            help='run the checks concurrently on N threads')
+        parser.add_argument('--timeout', type=float, help='the maximum time (in seconds) spent running the checks')
+        parser.add_argument('--format', choices=sorted(FORMATTERS), default='text')
+        parser.add_argument('--watch', type=float, metavar='INTERVAL',
+                            help='run the checks every INTERVAL seconds until interrupted')
+
+    def handle(self, *args, **options):
+        profile = options['profile']
+        if profile is not None and profile not in conf.PROFILES:
+            raise CommandError('Unknown profile `{}`'.format(profile), returncode=EXIT_ERROR)
+
+        check_options = {'profile': profile, 'deadline': options['timeout'] or None}
+        if options['parallel']:
+            check_options.update(concurrent=True, max_workers=options['parallel'])
+        sys.exit(self.run(check_options, FORMATTERS[options['format']], options['watch']))
+
+    def run(self, check_options, formatter, watch):
+        exit_code = EXIT_OK
+        try:
+            while True:
+                status = do_check(**check_options)
+                self.stdout.write(formatter(status).rstrip('\n'))
+                self.stdout.flush()
+                exit_code = EXIT_ERROR if status.errors else EXIT_WARNING if status.warnings else EXIT_OK
+                if not watch:
+                    break
+                time.sleep(watch)
+        except KeyboardInterrupt:
+            if not watch:
+                raise
+        return exit_code
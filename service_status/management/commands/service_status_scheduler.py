@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ...checks import get_checks
+from ...config import conf
+from ...scheduler import scheduler
+
+
+class Command(BaseCommand):
+    help = 'Run the checks on their interval, sharing the results through SERVICE_STATUS_SHARED_CACHE.'
+
+    def handle(self, *args, **options):
+        if not conf.SHARED_CACHE:
+            raise CommandError('SERVICE_STATUS_SHARED_CACHE is not set: the results would not be shared.')
+        if not any(check.cache_ttl for check in get_checks().checks):
+            raise CommandError('No check has a cache_ttl: the shared results would expire at once.')
+        self.stdout.write('Running the service status scheduler, press CTRL-C to stop.')
+        try:
+            scheduler.run_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import threading
+from bisect import bisect_left
+
+# upper bounds (in seconds) of the latency histogram buckets, the last bucket is +Inf
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATUSES = ('normal', 'warning', 'error', 'timeout')
+
+
+class CheckMetrics(object):
+    __slots__ = ('counts', 'sum', 'statuses')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.statuses = dict.fromkeys(STATUSES, 0)
+
+
+class MetricsRegistry(object):
+    """Latency histogram and count by status of the runs of every check, by check name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def observe(self, name, status, elapsed):
+        bucket = bisect_left(BUCKETS, elapsed)
+        with self._lock:
+            metrics = self._metrics.get(name)
+            if metrics is None:
+                metrics = self._metrics[name] = CheckMetrics()
+            metrics.counts[bucket] += 1
+            metrics.sum += elapsed
+            metrics.statuses[status] += 1
+
+    def get(self, name):
+        """Return the metrics of the check `name` as a dict, or None if it never ran.
+
+        `buckets` are the cumulative `(upper bound, count)` pairs of the histogram, as in Prometheus.
+        """
+        with self._lock:
+            metrics = self._metrics.get(name)
+            if metrics is None:
+                return None
+            counts = list(metrics.counts)
+            total = metrics.sum
+            statuses = dict(metrics.statuses)
+        buckets = []
+        count = 0
+        for upper_bound, bucket_count in zip(BUCKETS + (float('inf'),), counts):
+            count += bucket_count
+            buckets.append((upper_bound, count))
+        return {'buckets': buckets, 'count': count, 'sum': total, 'statuses': statuses}
+
+    def names(self):
+        with self._lock:
+            return sorted(self._metrics)
+
+    def clear(self):
+        with self._lock:
+            self._metrics.clear()
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import threading
+from time import monotonic
+
+from django.core.signals import setting_changed
+
+from .config import conf
+
+
+class Reporter(object):
+    """Decide which results of the checks are logged (to Sentry).
+
+    By default every warning and error is logged. With SERVICE_STATUS_REPORT_TRANSITIONS enabled, only the changes of
+    status of a check are (recoveries included), plus a reminder every SERVICE_STATUS_REPORT_INTERVAL seconds while
+    the status does not change. The state is kept per process.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last = {}
+
+    def should_report(self, check, status):
+        if not conf.REPORT_TRANSITIONS:
+            return status != 'normal'
+        now = monotonic()
+        with self._lock:
+            last_status, reported_at = self._last.get(check.name, ('normal', None))
+            if status == last_status:
+                if status == 'normal' or conf.REPORT_INTERVAL is None or now - reported_at < conf.REPORT_INTERVAL:
+                    return False
+            self._last[check.name] = (status, now)
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._last.clear()
+
+
+reporter = Reporter()
+
+
+def _handler(sender, setting, **kwargs):
+    if setting.startswith('SERVICE_STATUS'):
+        reporter.clear()
+
+
+setting_changed.connect(_handler)
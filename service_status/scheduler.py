@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
+from .checks import collect_status, get_checks, get_failed_dependency, refresh_check
+from .config import conf
+
+
+class Scheduler(object):
+    """Run every check on its own interval in background threads and keep the latest results in memory.
+
+    The thread does not survive a fork: the scheduler is restarted in the child process by the first
+    `snapshot()` call (e.g. in every pre-forked WSGI worker).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._results = {}
+        self._thread = None
+        self._pid = None
+
+    @property
+    def running(self):
+        return self._pid == os.getpid() and self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._lock:
+            if self.running:
+                return
+            self._pid = os.getpid()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self.run, args=(self._stop,), name='service-status-scheduler')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+        if self.running and self._thread is not threading.current_thread():
+            self._thread.join()
+        self._thread = None
+
+    def run_forever(self):
+        """Run the checks in the current thread until `stop()` is called (as the service_status_scheduler command).
+
+        The background thread, if started, is stopped first: the checks do not run twice.
+        """
+        with self._lock:
+            thread = self._thread if self.running else None
+            self._stop.set()
+            self._wakeup.set()
+            self._pid = os.getpid()
+            self._stop = stop = threading.Event()
+            self._thread = threading.current_thread()
+        if thread is not None:
+            thread.join()
+        self.run(stop)
+
+    def run(self, stop):
+        due = {}
+        executor = ThreadPoolExecutor(max_workers=conf.MAX_WORKERS)
+        try:
+            while not stop.is_set():
+                self._wakeup.clear()
+                now = monotonic()
+                if any(next_run <= now for next_run in due.values()) or not due:
+                    for check in get_checks().checks:
+                        if due.get(check.name, now) <= now:
+                            due[check.name] = float('inf')
+                            executor.submit(self._run_check, check, due)
+                timeout = min(due.values()) - monotonic() if due else conf.SCHEDULER_INTERVAL
+                self._wakeup.wait(max(min(timeout, conf.SCHEDULER_INTERVAL), 0))
+        finally:
+            executor.shutdown(wait=False)
+
+    def _run_check(self, check, due):
+        try:
+            with self._lock:
+                dependency = get_failed_dependency(check, self._results)
+            if dependency is not None:
+                check.skip(dependency)
+            else:
+                refresh_check(check)
+            with self._lock:
+                self._results[check.name] = check
+        finally:
+            due[check.name] = monotonic() + check.interval
+            self._wakeup.set()
+
+    def snapshot(self, profile=None):
+        """Return the SystemErrors of the latest results (of the checks of `profile`), without running any check."""
+        with self._lock:
+            results = dict(self._results)
+        self.start()
+        status = get_checks(profile)
+        checks = []
+        for check in status.checks:
+            result = results.get(check.name)
+            if result is None or result.__class__ is not check.__class__:
+                check.pending()
+                result = check
+            checks.append(result)
+        return collect_status(checks, status.errors, status.warnings)
+
+    def clear(self):
+        with self._lock:
+            self._results.clear()
+
+    def _after_fork(self):
+        # the lock may have been held by another thread of the parent process
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+
+scheduler = Scheduler()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=scheduler._after_fork)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import os
+import socket
+import uuid
+from time import time
+
+from django.core.cache import caches
+
+from .config import conf
+
+
+class SharedResultStore(object):
+    """Share the results of the checks among processes through a Django cache (SERVICE_STATUS_SHARED_CACHE).
+
+    A result is reused for `check.ttl` seconds. To refresh it, a process takes a lease on the check: while the lease
+    is held, the other processes keep serving the previous result instead of running the check too.
+    """
+
+    key_prefix = 'service_status'
+
+    def __init__(self, alias):
+        self.alias = alias
+        self.token = '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get_key(self, check, suffix=''):
+        return '{}:{}{}'.format(self.key_prefix, check.name, suffix)
+
+    def load(self, check):
+        data = self.cache.get(self.get_key(check))
+        if data is None or data.get('class') != check.class_path:
+            return None
+        return data
+
+    def is_fresh(self, check, data):
+        # as `check.ttl`: the skipped checks are failed ones
+        ttl = check.cache_error_ttl if data['status'] in ('error', 'timeout', 'skipped') else check.cache_ttl
+        return time() - data['completed'] < ttl
+
+    def save(self, check):
+        if check.completed is None or not check.ttl:
+            return
+        self.cache.set(self.get_key(check), check.serialize(), timeout=check.ttl + conf.SHARED_CACHE_LEASE)
+
+    def acquire(self, check):
+        return self.cache.add(self.get_key(check, ':lease'), self.token, timeout=conf.SHARED_CACHE_LEASE)
+
+    def release(self, check):
+        key = self.get_key(check, ':lease')
+        if self.cache.get(key) == self.token:
+            self.cache.delete(key)
+
+    def run(self, check):
+        """Restore the shared result of `check` if fresh, or run the check and share its result."""
+        data = self.load(check)
+        if data is not None and self.is_fresh(check, data):
+            check.restore(data)
+            return
+
+        if not self.acquire(check):
+            # another process is running the check: serve its previous result, if any
+            if data is not None:
+                check.restore(data)
+            else:
+                check.run()
+            return
+
+        try:
+            check.run()
+        finally:
+            self.save(check)
+            self.release(check)
+
+
+def get_shared_store():
+    """Return the SharedResultStore of SERVICE_STATUS_SHARED_CACHE, or None if not configured."""
+    alias = conf.SHARED_CACHE
+    if not alias:
+        return None
+    store = _stores.get(alias)
+    if store is None:
+        store = _stores.setdefault(alias, SharedResultStore(alias))
+    return store
+
+
+_stores = {}
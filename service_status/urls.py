@@ -3,10 +3,17 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 from django.urls import path
 
-from service_status.views import ServiceStatusView
+from service_status.views import (ServiceStatusJSONView, ServiceStatusMetricsView, ServiceStatusStreamView,
+                                  ServiceStatusView, async_service_status)
 
 app_name = 'service-status'
 
 urlpatterns = [
     path('', ServiceStatusView.as_view(), name='index'),
+    path('async/', async_service_status, name='async'),
+    path('json/', ServiceStatusJSONView.as_view(), name='json'),
+    path('metrics/', ServiceStatusMetricsView.as_view(), name='metrics'),
+    path('stream/', ServiceStatusStreamView.as_view(), name='stream'),
+    path('profiles/<slug:profile>/', ServiceStatusView.as_view(), name='profile'),
+    path('profiles/<slug:profile>/async/', async_service_status, name='profile-async'),
 ]
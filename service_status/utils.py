@@ -1,10 +1,19 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, print_function, unicode_literals
 
-import inspect
+import asyncio
 import os
 import six
-from time import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from http import client as http_client
+from time import perf_counter_ns, sleep
+from urllib.parse import urlsplit
+
+try:
+    from time import thread_time_ns
+except ImportError:  # pragma: no cover
+    from time import process_time_ns as thread_time_ns
 
 import psutil
 from django.core.signals import setting_changed
@@ -31,41 +40,244 @@ class AppSettings(object):
         setattr(self, name, value)
 
     def _handler(self, sender, setting, value, **kwargs):
-        if kwargs['enter'] and setting.startswith(self.prefix):
-            self._set_attr(setting, value)
+        if not setting.startswith(self.prefix + '_'):
+            return
+        if hasattr(self.django_settings, setting):
+            self._set_attr(setting, getattr(self.django_settings, setting))
+        else:
+            # the setting has been removed (e.g. an override has been disabled)
+            name = setting[len(self.prefix) + 1:]
+            if name in self.defaults:
+                setattr(self, name, self.defaults[name])
+            else:
+                self.__dict__.pop(name, None)
 
     def __getattr__(self, name):
         return getattr(self.django_settings, '_'.join([self.prefix, name]))
 
 
 class GetTime(object):
+    """Measure the wall-clock time (monotonic) and the CPU time of the current thread spent in a block."""
     name = None
     t1 = None
     t2 = None
+    cpu_t1 = None
+    cpu_t2 = None
     elapsed = None
+    cpu_elapsed = None
 
     def __init__(self, name=None, doprint=False):
         super(GetTime, self).__init__()
-        inspect_stack = inspect.stack()
-        self.name = name or inspect_stack[1][3]
+        self.name = name
         self.doprint = doprint
 
     def __enter__(self, name=None):
-        self.t1 = time()
+        self.cpu_t1 = thread_time_ns()
+        self.t1 = perf_counter_ns()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self.t2 = time()
-        self.elapsed = self.t2 - self.t1
-        message = '{}: {:0.3f}'.format(self.name, self.elapsed)
+        self.t2 = perf_counter_ns()
+        self.cpu_t2 = thread_time_ns()
+        self.elapsed = (self.t2 - self.t1) / 1e9
+        self.cpu_elapsed = (self.cpu_t2 - self.cpu_t1) / 1e9
         if self.doprint:  # pragma: no cover
-            print(message)
+            print('{}: {:0.3f} (cpu: {:0.3f})'.format(self.name, self.elapsed, self.cpu_elapsed))
+
+
+class SingleFlight(object):
+    """Share the outcome of a call among all the concurrent callers with the same key.
+
+    While a call is in flight, the other callers wait for it and get its result (or exception) instead of
+    making the same call again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+
+    def do(self, key, func, *args, **kwargs):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def ado(self, key, func, *args, **kwargs):
+        """Same as `do`, for a coroutine function; the calls are shared among the tasks of the same event loop."""
+        key = (key, asyncio.get_running_loop())
+        task = self._tasks.get(key)
+        if task is None:
+            task = self._tasks[key] = asyncio.ensure_future(func(*args, **kwargs))
+            task.add_done_callback(lambda task: self._tasks.pop(key, None))
+        # a cancelled caller does not cancel the call shared with the others
+        return await asyncio.shield(task)
+
+
+PROC_PATH = '/proc'
+
+
+def fan_out(func, items, cleanup=None):
+    """Call `func(item)` for all the `items` concurrently, one thread each, and wait for all of them.
+
+    Return the `(item, result, exception)` of every call, in the order of `items`. `cleanup` is called by every
+    thread once done (e.g. `connections.close_all`). A single item is processed in the current thread.
+    """
+    def call(item):
+        try:
+            return item, func(item), None
+        except Exception as e:
+            return item, None, e
+
+    def call_and_cleanup(item):
+        try:
+            return call(item)
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+    items = list(items)
+    if len(items) <= 1:
+        return [call(item) for item in items]
+    with ThreadPoolExecutor(max_workers=len(items)) as executor:
+        return list(executor.map(call_and_cleanup, items))
+
+
+class HttpConnectionPool(object):
+    """Keep-alive HTTP(S) connections reused across the requests, at most `maxsize` idle ones by host.
+
+    The idle connections are discarded in a forked process (e.g. a pre-forked WSGI worker): their sockets are shared
+    with the parent process.
+    """
+
+    def __init__(self, maxsize=4):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            # the lock may have been held by another thread of the parent process
+            self._lock = threading.Lock()
+            self._idle = {}
+            self._pid = os.getpid()
+
+    def get(self, scheme, netloc, timeout):
+        """Return an idle (or a new) connection to `netloc` and whether it is reused."""
+        key = (scheme, netloc)
+        self._check_pid()
+        with self._lock:
+            idle = self._idle.get(key)
+            connection = idle.pop() if idle else None
+        if connection is None:
+            connection_class = http_client.HTTPSConnection if scheme == 'https' else http_client.HTTPConnection
+            return connection_class(netloc, timeout=timeout), False
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        return connection, True
+
+    def put(self, scheme, netloc, connection):
+        """Give back a connection once its response has been read."""
+        self._check_pid()
+        with self._lock:
+            idle = self._idle.setdefault((scheme, netloc), [])
+            if len(idle) < self.maxsize:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def request(self, method, url, timeout, headers=None):
+        """Send a request on a pooled connection and return the response and its body.
+
+        A reused connection closed by the server in the meantime is replaced by a new one.
+        """
+        parts = urlsplit(url)
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        while True:
+            connection, reused = self.get(parts.scheme, parts.netloc, timeout)
+            try:
+                connection.request(method, path, headers=headers or {})
+                response = connection.getresponse()
+                body = response.read()
+            except (http_client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                connection.close()
+                raise
+            if response.will_close:
+                connection.close()
+            else:
+                self.put(parts.scheme, parts.netloc, connection)
+            return response, body
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+
+def get_user_swap_proc(uid):
+    """Return the swap memory used by the processes of `uid` reading `/proc/<pid>/status` (Linux only).
+
+    Returns None if the information is not available.
+    """
+    try:
+        pids = [pid for pid in os.listdir(PROC_PATH) if pid.isdigit()]
+        with open(os.path.join(PROC_PATH, 'self', 'status'), 'rb') as f:
+            if b'VmSwap:' not in f.read():
+                return None
+    except (IOError, OSError):
+        return None
+
+    total = 0
+    for pid in pids:
+        try:
+            with open(os.path.join(PROC_PATH, pid, 'status'), 'rb') as f:
+                for line in f:
+                    # `Uid:` always comes before `VmSwap:`, which is missing for kernel threads
+                    if line.startswith(b'Uid:'):
+                        if int(line.split()[1]) != uid:
+                            break
+                    elif line.startswith(b'VmSwap:'):
+                        total += int(line.split()[1]) * 1024
+                        break
+        except (IOError, OSError):  # the process is gone
+            pass
+    return total
 
 
 def get_user_swap():
+    uid = os.getuid()
+    total = get_user_swap_proc(uid)
+    if total is not None:
+        return total
+
     total = 0
-    for process in psutil.process_iter():
-        if process.uids()[0] == os.getuid():
+    for process in psutil.process_iter(attrs=['uids']):
+        uids = process.info['uids']
+        if uids and uids[0] == uid:
             try:
                 total += process.memory_full_info().swap
             except (psutil.AccessDenied, psutil.NoSuchProcess, AttributeError):
@@ -74,14 +286,34 @@ def get_user_swap():
 
 
 class DummyCeleryApp(object):
+    """A stand-in for a Celery app exposing `control.ping()`.
+
+    `response` is the reply of the workers (no reply if empty), `hostnames` the names of the running workers
+    (all of them if None) and `delay` the time (in seconds) the workers take to reply.
+    """
+
     def __init__(self):
         class Control(object):
             response = 'pong'
+            hostnames = None
+            delay = 0
 
-            def ping(self, names):
+            def ping(self, destination=None, timeout=1.0, callback=None, limit=None, **kwargs):
                 if not self.response:
-                    return None
-                return [{name: {'ok': self.response}} for name in names]
+                    return []
+                if self.delay:
+                    sleep(min(self.delay, timeout))
+                    if self.delay > timeout:
+                        return []
+                replies = []
+                for name in destination or []:
+                    if self.hostnames is not None and name not in self.hostnames:
+                        continue
+                    reply = {name: {'ok': self.response}}
+                    if callback:
+                        callback(reply)
+                    replies.append(reply)
+                return replies
 
         self.control = Control()
 
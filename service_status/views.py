@@ -1,38 +1,118 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, print_function, unicode_literals
 
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.utils.cache import add_never_cache_headers
 from django.utils.decorators import method_decorator
 from django.views.decorators.cache import never_cache
-from django.views.generic.base import TemplateView
+from django.views.generic.base import TemplateView, View
 
-from .checks import do_check
+from .checks import async_do_check, collect_status, do_check, get_checks, iter_results
+from .config import conf
+from .formatters import (check_to_dict, get_response_tag, summary_to_dict, to_json, to_ndjson_record, to_prometheus,
+                         to_sse_event)
+from .scheduler import scheduler
 
 
-class ServiceStatusView(TemplateView):
-    template_name = 'service_status/service_status.html'
-    response_status_code = 200
+def get_profile(request, profile=None):
+    """Return the profile of the request (from the URL or the `profile` parameter), raise Http404 if unknown."""
+    profile = profile or request.GET.get('profile') or None
+    if profile is not None and profile not in conf.PROFILES:
+        raise Http404('Unknown profile `{}`'.format(profile))
+    return profile
+
+
+class ServiceStatusMixin(object):
 
     @method_decorator(never_cache)
     def dispatch(self, request, *args, **kwargs):
-        return super(ServiceStatusView, self).dispatch(request, *args, **kwargs)
+        return super(ServiceStatusMixin, self).dispatch(request, *args, **kwargs)
 
-    def get_context_data(self, **kwargs):
-        status = do_check()
+    def get_profile(self):
+        return get_profile(self.request, self.kwargs.get('profile'))
+
+    def get_status(self):
+        profile = self.get_profile()
+        if conf.SCHEDULER:
+            return scheduler.snapshot(profile)
+        return do_check(profile)
+
+
+class ServiceStatusView(ServiceStatusMixin, TemplateView):
+    template_name = 'service_status/service_status.html'
+    response_status_code = 200
+
+    def get_context_data(self, status=None, **kwargs):
+        if status is None:
+            status = self.get_status()
 
         if status.errors:
             self.response_status_code = 503
-            response_tag = 'ERRORS_FOUND'
-        # elif status.warnings:
-        #     response_tag = 'WARNINGS_FOUND'
-        else:
-            response_tag = 'SERVICE_OPERATIONAL'
 
         kwargs.update({
             'status': status,
-            'response_tag': response_tag
+            'response_tag': get_response_tag(status)
         })
         return super(ServiceStatusView, self).get_context_data(**kwargs)
 
     def get(self, request, *args, **kwargs):
         context = self.get_context_data(**kwargs)
         return self.render_to_response(context, status=self.response_status_code)
+
+
+class ServiceStatusJSONView(ServiceStatusMixin, View):
+    """The status as compact JSON, with the same response status code of ServiceStatusView."""
+
+    def get(self, request, *args, **kwargs):
+        status = self.get_status()
+        return HttpResponse(to_json(status), content_type='application/json', status=503 if status.errors else 200)
+
+
+class ServiceStatusMetricsView(ServiceStatusMixin, View):
+    """The status in the Prometheus text exposition format."""
+
+    def get(self, request, *args, **kwargs):
+        return HttpResponse(to_prometheus(self.get_status()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class ServiceStatusStreamView(ServiceStatusMixin, View):
+    """Stream the result of every check as soon as it completes, then the overall status.
+
+    The checks run concurrently. Every result is a line of newline delimited JSON, or a server-sent event when the
+    client accepts `text/event-stream` (or with `?format=sse`). As the response starts before the checks complete,
+    its status code is always 200: the closing `summary` record carries the overall status.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get('format') == 'sse' or 'text/event-stream' in request.META.get('HTTP_ACCEPT', ''):
+            formatter, content_type = to_sse_event, 'text/event-stream'
+        else:
+            formatter, content_type = to_ndjson_record, 'application/x-ndjson'
+        response = StreamingHttpResponse(self.stream(self.get_profile(), formatter), content_type=content_type)
+        # do not let the proxies buffer the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def stream(self, profile, formatter):
+        checks, errors, warnings = get_checks(profile)
+        if conf.SCHEDULER:
+            results = scheduler.snapshot(profile).checks
+        else:
+            results = iter_results(checks, concurrent=True)
+        completed = []
+        for check in results:
+            completed.append(check)
+            yield formatter('check', check_to_dict(check))
+        yield formatter('summary', summary_to_dict(collect_status(completed, errors, warnings)))
+
+
+async def async_service_status(request, profile=None):
+    """Same as ServiceStatusView, running the checks concurrently on the event loop (for ASGI deployments)."""
+    profile = get_profile(request, profile)
+    view = ServiceStatusView()
+    view.setup(request)
+    status = scheduler.snapshot(profile) if conf.SCHEDULER else await async_do_check(profile)
+    context = view.get_context_data(status=status)
+    response = view.render_to_response(context, status=view.response_status_code)
+    add_never_cache_headers(response)
+    return response
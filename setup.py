@@ -54,6 +54,8 @@ setup(
     url='https://github.com/mrc75/django-service-status',
     packages=[
         'service_status',
+        'service_status.management',
+        'service_status.management.commands',
     ],
     include_package_data=True,
     install_requires=open('requirements.txt').read(),
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, print_function, unicode_literals
+
+import socketserver
+import threading
+
+import pytest
+
+
+class FakeRedisHandler(socketserver.StreamRequestHandler):
+    """Answer the `PING` and `INFO` commands of the Redis protocol (RESP), and `OK` to any other command."""
+
+    info = b'# Server\r\nredis_version:7.0.0\r\n# Clients\r\nconnected_clients:1\r\n'
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line.startswith(b'*'):
+            return None
+        args = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(length + 2)[:-2])
+        return args
+
+    def handle(self):
+        while True:
+            command = self.read_command()
+            if not command:
+                return
+            name = command[0].upper()
+            if name == b'PING':
+                self.wfile.write(b'+PONG\r\n')
+            elif name == b'INFO':
+                self.wfile.write(b'$' + str(len(self.info)).encode() + b'\r\n' + self.info + b'\r\n')
+            else:
+                self.wfile.write(b'+OK\r\n')
+            self.wfile.flush()
+
+
+class FakeRedisServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+@pytest.fixture(scope='session')
+def fake_redis():
+    server = FakeRedisServer(('127.0.0.1', 0), FakeRedisHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'redis://127.0.0.1:{}/0'.format(server.server_address[1])
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Latency benchmarks of the status checks, run with `make benchmark`."""
+from __future__ import absolute_import, print_function, unicode_literals
+
+import mock
+import pytest
+from django.urls import reverse
+
+from service_status.checks import CeleryCheck, DatabaseCheck, RedisCheck, SwapCheck, do_check, run_check
+from service_status.utils import dummy_celery_app
+
+pytest.importorskip('pytest_benchmark')
+
+
+@pytest.fixture(autouse=True)
+def mock_sentry(monkeypatch):
+    monkeypatch.setattr('service_status.checks.sentry', mock.Mock())
+
+
+def run(check_class, **kwargs):
+    check = check_class(name='BENCHMARK', **kwargs)
+    run_check(check)
+    return check
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('concurrent', [False, True])
+def test_do_check(benchmark, service_status_settings, concurrent):
+    service_status_settings.SERVICE_STATUS_CONCURRENT = concurrent
+    status = benchmark(do_check)
+    assert status.errors == []
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('mode', DatabaseCheck.modes)
+def test_database_check(benchmark, mode):
+    check = benchmark(run, DatabaseCheck, mode=mode)
+    assert check.status == 'normal'
+
+
+def test_swap_check(benchmark):
+    check = benchmark(run, SwapCheck, limit=float('inf'))
+    assert check.status == 'normal'
+
+
+@pytest.mark.parametrize('delay', [0, 0.001, 0.01])
+def test_celery_check(benchmark, monkeypatch, delay):
+    monkeypatch.setattr(dummy_celery_app.control, 'response', 'pong')
+    monkeypatch.setattr(dummy_celery_app.control, 'delay', delay)
+    check = benchmark(run, CeleryCheck, celery_app_fqn='service_status.utils.dummy_celery_app',
+                      worker_names=['worker{}'.format(i) for i in range(20)])
+    assert check.status == 'normal'
+
+
+@pytest.mark.parametrize('info_fields', [(), ('redis_version', 'connected_clients')])
+def test_redis_check(benchmark, fake_redis, info_fields):
+    pytest.importorskip('redis')
+    check = benchmark(run, RedisCheck, redis_url=fake_redis, info_fields=info_fields)
+    assert check.status == 'normal', check.output
+
+
+@pytest.mark.django_db
+def test_view(benchmark, client):
+    url = reverse('service-status:index')
+    response = benchmark(client.get, url)
+    assert response.status_code == 200
@@ -3,6 +3,9 @@ from __future__ import absolute_import, print_function, unicode_literals
 
 import itertools
 import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import django_webtest
 import mock
@@ -11,6 +14,21 @@ import pytest
 from service_status.exceptions import SystemStatusWarning
 
 
+@pytest.fixture(autouse=True)
+def last_successes(monkeypatch):
+    _last_successes = {}
+    monkeypatch.setattr('service_status.checks.last_successes', _last_successes)
+    return _last_successes
+
+
+@pytest.fixture(autouse=True)
+def check_metrics():
+    from service_status.metrics import metrics
+
+    metrics.clear()
+    return metrics
+
+
 @pytest.fixture
 def app(request):
     wtm = django_webtest.WebTestMixin()
@@ -29,8 +47,8 @@ def mock_dbcheck(monkeypatch):
 
 @pytest.fixture
 def mock_time(monkeypatch):
-    _mock = mock.Mock(side_effect=itertools.cycle([3, 10]))
-    monkeypatch.setattr('service_status.utils.time', _mock)
+    _mock = mock.Mock(side_effect=itertools.cycle([3 * 10 ** 9, 10 * 10 ** 9]))
+    monkeypatch.setattr('service_status.utils.perf_counter_ns', _mock)
     return _mock
 
 
@@ -49,6 +67,20 @@ def mock_get_user_swap(monkeypatch):
     return _mock
 
 
+@pytest.fixture()
+def service_status_settings(settings):
+    """The `settings` fixture, resetting the application settings once the overrides are restored."""
+    from django.conf import settings as django_settings
+    from service_status.config import conf
+
+    names = set(name for name in dir(django_settings) if name.startswith(conf.prefix))
+    yield settings
+    for name in dir(django_settings):
+        if name.startswith(conf.prefix) and name not in names:
+            delattr(settings, name)
+    conf.__init__(conf.prefix)
+
+
 @pytest.fixture()
 def settings_alias(settings):
     from service_status.config import conf
@@ -88,6 +120,7 @@ def settings_celery(settings):
 
 @pytest.fixture()
 def settings_redis(settings):
+    from service_status.checks import redis_clients
     from service_status.config import conf
 
     settings.SERVICE_STATUS_CHECKS = (
@@ -96,24 +129,176 @@ def settings_redis(settings):
     settings.SERVICE_STATUS_INIT_REDIS = {
         'redis_url': 'redis://localhost:6379/13'
     }
+    redis_clients.clear()
     yield
+    redis_clients.clear()
     delattr(settings, 'SERVICE_STATUS_CHECKS')
     delattr(settings, 'SERVICE_STATUS_INIT_REDIS')
     conf.__init__(conf.prefix)
 
 
+@pytest.fixture()
+def settings_concurrent(settings_alias, settings):
+    from service_status.config import conf
+
+    settings.SERVICE_STATUS_CONCURRENT = True
+    yield
+    delattr(settings, 'SERVICE_STATUS_CONCURRENT')
+    conf.__init__(conf.prefix)
+
+
+@pytest.fixture()
+def settings_timeout(settings):
+    from service_status.config import conf
+
+    settings.SERVICE_STATUS_INIT_DB_DEFAULT = {
+        'model_name': 'sessions.Session',
+        'timeout': 0.1,
+    }
+    yield
+    delattr(settings, 'SERVICE_STATUS_INIT_DB_DEFAULT')
+    conf.__init__(conf.prefix)
+
+
+@pytest.fixture()
+def settings_deadline(settings):
+    from service_status.config import conf
+
+    settings.SERVICE_STATUS_DEADLINE = 0.2
+    yield
+    delattr(settings, 'SERVICE_STATUS_DEADLINE')
+    conf.__init__(conf.prefix)
+
+
+@pytest.fixture()
+def settings_cache(settings):
+    from service_status.config import conf
+
+    settings.SERVICE_STATUS_CACHE_TTL = 60
+    settings.SERVICE_STATUS_CACHE_ERROR_TTL = 0
+    yield
+    delattr(settings, 'SERVICE_STATUS_CACHE_TTL')
+    delattr(settings, 'SERVICE_STATUS_CACHE_ERROR_TTL')
+    conf.__init__(conf.prefix)
+
+
+@pytest.fixture()
+def settings_shared_cache(settings):
+    from django.core.cache import caches
+    from service_status.config import conf
+
+    settings.CACHES = dict(settings.CACHES, status={
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'service-status',
+    })
+    settings.SERVICE_STATUS_SHARED_CACHE = 'status'
+    settings.SERVICE_STATUS_CACHE_TTL = 60
+    yield caches['status']
+    caches['status'].clear()
+    delattr(settings, 'SERVICE_STATUS_SHARED_CACHE')
+    delattr(settings, 'SERVICE_STATUS_CACHE_TTL')
+    conf.__init__(conf.prefix)
+
+
+@pytest.fixture()
+def settings_breaker(settings):
+    from service_status.config import conf
+
+    settings.SERVICE_STATUS_BREAKER_THRESHOLD = 2
+    settings.SERVICE_STATUS_BREAKER_BACKOFF = 10
+    yield
+    delattr(settings, 'SERVICE_STATUS_BREAKER_THRESHOLD')
+    delattr(settings, 'SERVICE_STATUS_BREAKER_BACKOFF')
+    conf.__init__(conf.prefix)
+
+
+@pytest.fixture()
+def settings_report(settings):
+    from service_status.config import conf
+
+    settings.SERVICE_STATUS_REPORT_TRANSITIONS = True
+    yield
+    delattr(settings, 'SERVICE_STATUS_REPORT_TRANSITIONS')
+    conf.__init__(conf.prefix)
+
+
+@pytest.fixture()
+def settings_scheduler(settings):
+    from service_status.config import conf
+    from service_status.scheduler import scheduler
+
+    settings.SERVICE_STATUS_SCHEDULER = True
+    settings.SERVICE_STATUS_SCHEDULER_INTERVAL = 0.05
+    yield scheduler
+    scheduler.stop()
+    scheduler.clear()
+    delattr(settings, 'SERVICE_STATUS_SCHEDULER')
+    delattr(settings, 'SERVICE_STATUS_SCHEDULER_INTERVAL')
+    conf.__init__(conf.prefix)
+
+
+@pytest.fixture()
+def settings_async(settings):
+    from service_status.config import conf
+
+    settings.SERVICE_STATUS_CHECKS = (
+        ('DB_DEFAULT', 'service_status.checks.DatabaseCheck'),
+        ('SLEEP1', 'tests.test_systemstatus.AsyncSleepCheck'),
+        ('SLEEP2', 'tests.test_systemstatus.AsyncSleepCheck'),
+        ('SWAP', 'service_status.checks.SwapCheck'),
+    )
+    yield
+    delattr(settings, 'SERVICE_STATUS_CHECKS')
+    conf.__init__(conf.prefix)
+
+
+@pytest.fixture
+def mock_hanging_dbcheck(monkeypatch):
+    release = threading.Event()
+    threads = []
+
+    def hang():
+        threads.append(threading.current_thread())
+        release.wait(5)
+
+    _mock = mock.Mock(side_effect=hang)
+    monkeypatch.setattr('service_status.checks.DatabaseCheck._run', _mock)
+    yield _mock
+    release.set()
+    # the abandoned checks must complete before the next test mocks the time
+    for thread in threads:
+        if thread is not threading.current_thread():
+            thread.join(5)
+
+
 @pytest.fixture
-def mock_psutil_process_iter(monkeypatch):
+def mock_psutil_process_iter(monkeypatch, tmp_path):
+    # disable the /proc fast path
+    monkeypatch.setattr('service_status.utils.PROC_PATH', str(tmp_path / 'proc'))
     _mock = mock.Mock(return_value=[])
     monkeypatch.setattr('psutil.process_iter', _mock)
     return _mock
 
 
+@pytest.fixture
+def mock_proc(mock_psutil_process_iter, tmp_path):
+    # a fake /proc where the fast path of get_user_swap is enabled
+    def add_process(pid, uid, swap=None):
+        os.makedirs(str(tmp_path / 'proc' / pid))
+        lines = ['Name:\tfoo', 'Uid:\t{uid}\t{uid}\t{uid}\t{uid}'.format(uid=uid), 'VmRSS:\t     100 kB']
+        if swap is not None:
+            lines.append('VmSwap:\t{:>8} kB'.format(swap))
+        (tmp_path / 'proc' / pid / 'status').write_text('\n'.join(lines + ['Threads:\t1']))
+
+    add_process('self', os.getuid(), 0)
+    return add_process
+
+
 @pytest.fixture
 def mock_process1(monkeypatch):
     _mock = mock.Mock()
-    # process.uids()[0] == os.getuid():
-    _mock.uids.return_value = [os.getuid()]
+    # process.info['uids'][0] == os.getuid():
+    _mock.info = {'uids': [os.getuid()]}
     # process.memory_full_info().swap
     _mock.memory_full_info.return_value.swap = 10
     return _mock
@@ -122,8 +307,57 @@ def mock_process1(monkeypatch):
 @pytest.fixture
 def mock_process2(monkeypatch):
     _mock = mock.Mock()
-    # process.uids()[0] == os.getuid():
-    _mock.uids.return_value = [os.getuid()]
+    # process.info['uids'][0] == os.getuid():
+    _mock.info = {'uids': [os.getuid()]}
     # process.memory_full_info().swap
     _mock.memory_full_info.side_effect = AttributeError('opss')
     return _mock
+
+
+@pytest.fixture
+def mock_process3(monkeypatch):
+    _mock = mock.Mock()
+    # uids is None when the access is denied
+    _mock.info = {'uids': None}
+    return _mock
+
+
+class HttpHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super(HttpHandler, self).setup()
+        self.server.connections.append(self.client_address)
+
+    def do_GET(self):
+        if self.path == '/slow':
+            time.sleep(0.3)
+        body = b'pong'
+        try:
+            self.send_response(500 if self.path == '/fail' else 200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client timed out
+            self.close_connection = True
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_server():
+    """A local HTTP server, counting the connections it accepts."""
+    from service_status.checks import http_pool
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), HttpHandler)
+    server.daemon_threads = True
+    server.connections = []
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield server
+    http_pool.clear()
+    server.shutdown()
+    server.server_close()
+    thread.join()
@@ -1,15 +1,34 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, print_function, unicode_literals
 
+import asyncio
+import json
+import re
+import socket
+import threading
+import time
+import traceback
+from decimal import Decimal
+
 import mock
 import pytest
+import six
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.core.signals import setting_changed
+from django.db import DatabaseError, connections
+from django.test import AsyncClient
 
 try:
     from django.urls import reverse
 except ImportError:
     from django.core.urlresolvers import reverse
 
-from service_status.exceptions import SystemStatusError
+from service_status.breaker import breakers
+from service_status.checks import (DatabaseCheck, DatabasesCheck, RedisCheck, SystemCheckBase, async_do_check,
+                                   do_check, get_checks, iter_checks, registry, run_check)
+from service_status.config import conf
+from service_status.exceptions import SystemStatusError, SystemStatusTimeout
 from service_status.utils import dummy_celery_app
 
 
@@ -51,7 +70,7 @@ def test_celery(settings_celery, app, mock_time):
     assert mock_time.call_count == 2
     expected = """\
 SERVICE_OPERATIONAL
-CeleryCheck CELERY: got response from 3 worker(s) (7.000s)"""
+CeleryCheck CELERY: got response from 3 worker(s): foo 0ms, bar 0ms, baz 0ms (7.000s)"""
     assert response.pyquery('#main').text() == expected
 
 
@@ -64,7 +83,7 @@ def test_celery_notfound(settings_celery, app, mock_time):
     assert mock_time.call_count == 2
     expected = """\
 ERRORS_FOUND
-CeleryCheck CELERY: celery worker `foo` was not found (7.000s)"""
+CeleryCheck CELERY: celery worker(s) `foo`, `bar`, `baz` not found (7.000s)"""
     assert response.pyquery('#main').text() == expected
 
 
@@ -77,7 +96,7 @@ def test_celery_failure(settings_celery, app, mock_time):
     assert mock_time.call_count == 2
     expected = """\
 ERRORS_FOUND
-CeleryCheck CELERY: celery worker `foo` did not respond (7.000s)"""
+CeleryCheck CELERY: celery worker(s) `foo`, `bar`, `baz` did not respond (7.000s)"""
     assert response.pyquery('#main').text() == expected
 
 
@@ -104,8 +123,10 @@ def test_warning2(app, mock_dbcheck, mock_time, mock_sentry, mock_get_user_swap)
     assert mock_dbcheck.call_count == 1
     assert mock_time.call_count == 4
     assert mock_sentry.warning.call_count == 2
-    assert mock_sentry.warning.call_args_list == [mock.call('GOSH'),
-                                                  mock.call(u'the user swap memory is above 0 KB')]
+    assert mock_sentry.warning.call_args_list == [
+        mock.call('GOSH', extra=mock.ANY),
+        mock.call(u'the user swap memory is above 0 KB', extra=mock.ANY),
+    ]
     assert mock_get_user_swap.call_count == 1
     expected = """\
 SERVICE_OPERATIONAL
@@ -162,7 +183,8 @@ RedisCheck REDIS: cannot import redis library (7.000s)"""
 @pytest.mark.django_db
 def test_redis_not_connected(redis_mock, settings_redis, app, mock_time):
     redis_mock.connection.ConnectionError = Exception
-    redis_mock.StrictRedis.side_effect = Exception()
+    redis_mock.exceptions.TimeoutError = Exception
+    redis_mock.StrictRedis.from_url.side_effect = Exception()
     url = reverse('service-status:index')
     response = app.get(url, status=503)
 
@@ -178,10 +200,1202 @@ RedisCheck REDIS: unable to connect (7.000s)"""
 def test_redis_status_active(redis_mock, settings_redis, app, mock_time):
     url = reverse('service-status:index')
     response = app.get(url, status=200)
-    assert redis_mock.StrictRedis.call_count == 1
-    redis_mock.StrictRedis.assert_called_with(host=u'localhost', port=u'6379', db=u'13', socket_timeout=0.1)
+    assert redis_mock.StrictRedis.from_url.call_count == 1
+    redis_mock.StrictRedis.from_url.assert_called_with('redis://localhost:6379/13', socket_timeout=0.1,
+                                                       socket_connect_timeout=0.1)
     assert mock_time.call_count == 2
     expected = """\
 SERVICE_OPERATIONAL
 RedisCheck REDIS: active (7.000s)"""
     assert response.pyquery('#main').text() == expected
+
+
+@pytest.mark.django_db(databases=['default', 'interface'])
+def test_concurrent(settings_concurrent, monkeypatch, mock_sentry):
+    threads = set()
+
+    def slow_run(self):
+        threads.add(threading.current_thread())
+        time.sleep(0.2)
+        if self.name == 'DB_INTERFACE':
+            raise SystemStatusError('BOOM')
+
+    monkeypatch.setattr('service_status.checks.DatabaseCheck._run', slow_run)
+    monkeypatch.setattr('service_status.checks.SwapCheck._run', slow_run)
+
+    start = time.time()
+    status = do_check()
+    assert time.time() - start < 0.5
+    assert threading.current_thread() not in threads
+    assert len(threads) == 3
+    assert [check.name for check in status.checks] == ['DB_DEFAULT', 'DB_INTERFACE', 'SWAP']
+    assert [check.status for check in status.checks] == ['normal', 'error', 'normal']
+    assert [str(e) for e in status.errors] == ['BOOM']
+    assert status.warnings == []
+
+
+@pytest.mark.django_db(databases=['default', 'interface'])
+def test_concurrent_view(settings_concurrent, app, mock_sentry, mock_get_user_swap):
+    url = reverse('service-status:index')
+    response = app.get(url)
+    assert mock_get_user_swap.call_count == 1
+    assert [li.text.split(' (')[0] for li in response.pyquery('#main li')] == [
+        'DatabaseCheck DB_DEFAULT: sessions.Session',
+        'DatabaseCheck DB_INTERFACE: auth.group',
+        'SwapCheck SWAP: the user swap memory is: 0 KB',
+    ]
+
+
+@pytest.mark.django_db
+def test_timeout(settings_timeout, app, mock_hanging_dbcheck, mock_sentry, mock_get_user_swap):
+    url = reverse('service-status:index')
+    start = time.time()
+    response = app.get(url, status=503)
+    assert time.time() - start < 1
+    assert mock_hanging_dbcheck.call_count == 1
+    assert [args for args, _ in mock_sentry.error.call_args_list] == [('DB_DEFAULT: timed out',)]
+    assert mock_get_user_swap.call_count == 1
+    assert [li.attrib['class'] for li in response.pyquery('#main li')] == ['timeout', 'normal']
+    assert response.pyquery('#main li').eq(0).text().startswith('DatabaseCheck DB_DEFAULT: timed out (0.1')
+
+
+@pytest.mark.django_db
+def test_deadline(settings_deadline, mock_hanging_dbcheck, mock_sentry, mock_get_user_swap):
+    start = time.time()
+    status = do_check()
+    assert time.time() - start < 1
+    assert [check.status for check in status.checks] == ['timeout', 'timeout']
+    assert [check.output for check in status.checks] == ['timed out', 'not started before the deadline']
+    assert [str(e) for e in status.errors] == ['timed out', 'not started before the deadline']
+    assert 0.15 <= status.checks[0].elapsed < 1
+    assert status.checks[1].elapsed == 0
+    assert mock_get_user_swap.call_count == 0
+
+
+@pytest.mark.django_db(databases=['default', 'interface'])
+def test_deadline_concurrent(settings_concurrent, settings_deadline, mock_hanging_dbcheck, mock_sentry,
+                             mock_get_user_swap):
+    status = do_check()
+    assert [check.status for check in status.checks] == ['timeout', 'timeout', 'normal']
+    assert len(status.errors) == 2
+    assert mock_get_user_swap.call_count == 1
+
+
+@pytest.mark.django_db(databases=['default', 'interface'])
+def test_max_workers_improperly_configured(settings_concurrent, settings, mock_sentry, mock_get_user_swap):
+    settings.SERVICE_STATUS_MAX_WORKERS = 0
+    with pytest.raises(ImproperlyConfigured) as exception_info:
+        do_check()
+    assert str(exception_info.value) == 'SERVICE_STATUS_MAX_WORKERS must be at least 1, not 0'
+    with pytest.raises(ImproperlyConfigured):
+        list(iter_checks(get_checks().checks, concurrent=True, max_workers=-1))
+
+
+@pytest.mark.django_db
+def test_cache(settings_cache, app, mock_sentry, mock_get_user_swap):
+    url = reverse('service-status:index')
+    response = app.get(url)
+    assert [li.text.endswith('[age: 0.0s]') for li in response.pyquery('#main li')] == [True, True]
+
+    status = do_check()
+    assert mock_get_user_swap.call_count == 1
+    assert [check.status for check in status.checks] == ['normal', 'normal']
+
+
+@pytest.mark.django_db
+def test_cache_stale_while_revalidate(settings_cache, mock_sentry, mock_get_user_swap):
+    first = do_check()
+    first.checks[1].completed -= 60
+
+    status = do_check()
+    assert status.checks == first.checks
+
+    for _ in range(50):
+        refreshed = do_check()
+        if refreshed.checks[1] is not first.checks[1]:
+            break
+        time.sleep(0.01)
+    assert refreshed.checks[0] is first.checks[0]
+    assert refreshed.checks[1] is not first.checks[1]
+    assert mock_get_user_swap.call_count == 2
+
+
+@pytest.mark.django_db
+def test_cache_errors(settings_cache, mock_dbcheck, mock_sentry, mock_get_user_swap):
+    mock_dbcheck.side_effect = SystemStatusError('BOOM')
+    do_check()
+    status = do_check()
+    assert mock_dbcheck.call_count == 2
+    assert mock_get_user_swap.call_count == 1
+    assert [str(e) for e in status.errors] == ['BOOM']
+    assert status.checks[0].age is None
+
+
+@pytest.mark.django_db
+def test_shared_cache(settings_shared_cache, mock_sentry, mock_get_user_swap):
+    check = get_checks().checks[1]
+    assert run_check(check) is None
+    assert mock_get_user_swap.call_count == 1
+
+    # another process
+    shared = get_checks().checks[1]
+    assert run_check(shared) is None
+    assert mock_get_user_swap.call_count == 1
+    assert (shared.status, shared.output, shared.elapsed) == (check.status, check.output, check.elapsed)
+    assert 0 <= shared.age < 1
+
+
+@pytest.mark.django_db
+def test_shared_cache_lease(settings_shared_cache, mock_sentry, mock_get_user_swap):
+    cache = settings_shared_cache
+    check = get_checks().checks[1]
+    run_check(check)
+    key = 'service_status:SWAP'
+    cache.set(key, dict(cache.get(key), completed=time.time() - 120))
+    cache.set(key + ':lease', 'another process')
+
+    stale = get_checks().checks[1]
+    assert run_check(stale) is None
+    assert mock_get_user_swap.call_count == 1
+    assert 120 <= stale.age < 121
+
+    cache.delete(key + ':lease')
+    fresh = get_checks().checks[1]
+    run_check(fresh)
+    assert mock_get_user_swap.call_count == 2
+    assert fresh.age < 1
+    assert cache.get(key + ':lease') is None
+
+
+@pytest.mark.django_db
+def test_shared_cache_errors(settings_shared_cache, mock_dbcheck, mock_sentry, mock_get_user_swap):
+    mock_dbcheck.side_effect = SystemStatusError('BOOM')
+    assert str(run_check(get_checks().checks[0])) == 'BOOM'
+    # errors are not cached (SERVICE_STATUS_CACHE_ERROR_TTL = 0)
+    assert settings_shared_cache.get('service_status:DB_DEFAULT') is None
+
+    check = get_checks().checks[0]
+    check.cache_error_ttl = 60
+    run_check(check)
+    restored = get_checks().checks[0]
+    restored.cache_error_ttl = 60
+    assert str(run_check(restored)) == 'BOOM'
+    assert mock_dbcheck.call_count == 2
+    assert restored.status == 'error'
+    assert mock_sentry.error.call_count == 2
+
+
+def test_shared_cache_is_fresh(settings_shared_cache):
+    from service_status.store import get_shared_store
+
+    store = get_shared_store()
+    check = get_checks().checks[1]
+    check.cache_ttl, check.cache_error_ttl = 60, 5
+    completed = time.time() - 10
+    assert [store.is_fresh(check, {'status': status, 'completed': completed})
+            for status in ('normal', 'warning', 'error', 'timeout', 'skipped')] == [True, True, False, False, False]
+
+
+@pytest.mark.django_db
+def test_breaker(settings_breaker, app, mock_dbcheck, mock_sentry, mock_get_user_swap):
+    mock_dbcheck.side_effect = SystemStatusError('BOOM')
+    do_check()
+    status = do_check()
+    assert status.checks[0].circuit == 'open'
+    assert 5 <= status.checks[0].circuit_retry_in <= 10
+
+    url = reverse('service-status:index')
+    response = app.get(url, status=503)
+    assert mock_dbcheck.call_count == 2
+    assert mock_sentry.error.call_count == 2
+    assert response.pyquery('#main li').eq(0).text().startswith(
+        'DatabaseCheck DB_DEFAULT: BOOM (0.000s) [circuit open, retry in ')
+    assert mock_get_user_swap.call_count == 3
+
+    # half-open: a single run is let through
+    breakers['DB_DEFAULT'].retry_at = 0
+    mock_dbcheck.side_effect = None
+    mock_dbcheck.return_value = 'DB OK'
+    status = do_check()
+    assert mock_dbcheck.call_count == 3
+    assert status.checks[0].circuit is None
+    assert status.errors == []
+    assert breakers['DB_DEFAULT'].state == 'closed'
+
+
+@pytest.mark.django_db
+def test_breaker_backoff(settings_breaker, mock_dbcheck, mock_sentry, mock_get_user_swap):
+    mock_dbcheck.side_effect = SystemStatusError('BOOM')
+    do_check()
+    do_check()
+    breaker = breakers['DB_DEFAULT']
+    breaker.retry_at = 0
+
+    status = do_check()
+    assert mock_dbcheck.call_count == 3
+    assert breaker.trips == 2
+    assert 10 <= status.checks[0].circuit_retry_in <= 20
+
+    assert [str(e) for e in do_check().errors] == ['BOOM']
+    assert mock_dbcheck.call_count == 3
+
+
+@pytest.mark.django_db
+def test_breaker_error_traceback(settings_breaker, mock_dbcheck, mock_sentry, mock_get_user_swap):
+    mock_dbcheck.side_effect = SystemStatusError('BOOM')
+    do_check()
+    do_check()
+    errors = [do_check().checks[0].error for _ in range(3)]
+    assert mock_dbcheck.call_count == 2
+    assert [str(error) for error in errors] == ['BOOM'] * 3
+    # the stored error is not raised again, its traceback does not grow
+    stored = breakers['DB_DEFAULT'].error
+    assert all(error is not stored for error in errors)
+    assert len(traceback.extract_tb(errors[-1].__traceback__)) == len(traceback.extract_tb(errors[0].__traceback__))
+
+
+@pytest.mark.django_db
+def test_breaker_disabled(mock_dbcheck, mock_sentry, mock_get_user_swap):
+    mock_dbcheck.side_effect = SystemStatusError('BOOM')
+    for _ in range(3):
+        do_check()
+    assert mock_dbcheck.call_count == 3
+    assert breakers == {}
+
+
+@pytest.mark.django_db
+def test_report_transitions(settings_report, mock_dbcheck, mock_sentry, mock_get_user_swap):
+    fingerprint = ['service-status', 'service_status.checks.DatabaseCheck', 'DB_DEFAULT']
+    do_check()
+    do_check()
+    assert mock_sentry.warning.call_args_list == [mock.call('GOSH', extra={'fingerprint': fingerprint})]
+
+    mock_dbcheck.side_effect = SystemStatusError('BOOM')
+    do_check()
+    do_check()
+    assert mock_sentry.error.call_args_list == [mock.call('BOOM', extra={'fingerprint': fingerprint})]
+
+    mock_dbcheck.side_effect = None
+    mock_dbcheck.return_value = 'DB OK'
+    do_check()
+    do_check()
+    assert mock_sentry.info.call_args_list == [mock.call('DB_DEFAULT: recovered', extra={'fingerprint': fingerprint})]
+    assert mock_sentry.warning.call_count == 1
+    assert mock_sentry.error.call_count == 1
+
+
+@pytest.mark.django_db
+def test_report_interval(settings_report, settings, mock_dbcheck, mock_sentry, mock_get_user_swap):
+    mock_dbcheck.side_effect = SystemStatusError('BOOM')
+    do_check()
+    do_check()
+    assert mock_sentry.error.call_count == 1
+
+    settings.SERVICE_STATUS_REPORT_INTERVAL = 0
+    do_check()
+    do_check()
+    assert mock_sentry.error.call_count == 3
+
+
+@pytest.mark.django_db
+def test_json(app, mock_dbcheck, mock_time, mock_sentry, mock_get_user_swap):
+    mock_dbcheck.side_effect = SystemStatusError('BOOM')
+    start = time.time()
+    response = app.get(reverse('service-status:json'), status=503)
+    assert response.content_type == 'application/json'
+    data = response.json
+    assert response.text == json.dumps(data, separators=(',', ':'))
+    last_success = data['checks'][1].pop('last_success')
+    assert start <= last_success <= time.time()
+    assert data == {
+        'status': 'ERRORS_FOUND',
+        'checks': [
+            {'name': 'DB_DEFAULT', 'class': 'service_status.checks.DatabaseCheck', 'status': 'error',
+             'output': 'BOOM', 'elapsed': 7.0, 'cpu_elapsed': mock.ANY, 'last_success': None},
+            {'name': 'SWAP', 'class': 'service_status.checks.SwapCheck', 'status': 'normal',
+             'output': 'the user swap memory is: 0 KB (limit: 0 KB)', 'elapsed': 7.0, 'cpu_elapsed': mock.ANY},
+        ],
+        'errors': ['BOOM'],
+        'warnings': [],
+    }
+
+
+@pytest.mark.django_db
+def test_metrics(app, mock_dbcheck, mock_time, mock_sentry, mock_get_user_swap):
+    mock_dbcheck.side_effect = SystemStatusTimeout('timed out')
+    response = app.get(reverse('service-status:metrics'))
+    assert response.content_type == 'text/plain'
+    lines = response.text.splitlines()
+    assert 'service_status_up 0.0' in lines
+    assert [line for line in lines if line.startswith('service_status_check_status{check="DB_DEFAULT"')] == [
+        'service_status_check_status{check="DB_DEFAULT",status="normal"} 0.0',
+        'service_status_check_status{check="DB_DEFAULT",status="warning"} 0.0',
+        'service_status_check_status{check="DB_DEFAULT",status="error"} 0.0',
+        'service_status_check_status{check="DB_DEFAULT",status="timeout"} 1.0',
+        'service_status_check_status{check="DB_DEFAULT",status="skipped"} 0.0',
+    ]
+    assert 'service_status_check_elapsed_seconds{check="SWAP"} 7.0' in lines
+    assert [line.split(' ')[0] for line in lines if line.startswith('service_status_check_last_success')] == [
+        'service_status_check_last_success_timestamp_seconds{check="SWAP"}',
+    ]
+
+
+@pytest.mark.django_db
+def test_check_metrics(app, check_metrics, mock_dbcheck, mock_time, mock_sentry, mock_get_user_swap):
+    do_check()
+    mock_dbcheck.side_effect = SystemStatusError('BOOM')
+    do_check()
+    data = check_metrics.get('DB_DEFAULT')
+    assert data['statuses'] == {'normal': 0, 'warning': 1, 'error': 1, 'timeout': 0}
+    assert (data['count'], data['sum']) == (2, 14.0)
+    assert data['buckets'][-3:] == [(5.0, 0), (10.0, 2), (float('inf'), 2)]
+    assert check_metrics.get('SWAP')['statuses']['normal'] == 2
+    assert check_metrics.get('CELERY') is None
+
+    lines = app.get(reverse('service-status:metrics')).text.splitlines()
+    assert 'service_status_check_duration_seconds_bucket{check="DB_DEFAULT",le="5.0"} 0.0' in lines
+    assert 'service_status_check_duration_seconds_bucket{check="DB_DEFAULT",le="+Inf"} 3.0' in lines
+    assert 'service_status_check_duration_seconds_sum{check="DB_DEFAULT"} 21.0' in lines
+    assert 'service_status_check_duration_seconds_count{check="DB_DEFAULT"} 3.0' in lines
+    assert 'service_status_check_runs_total{check="DB_DEFAULT",status="error"} 2.0' in lines
+
+
+@pytest.mark.django_db
+def test_check_metrics_timeout(settings_timeout, check_metrics, mock_hanging_dbcheck, mock_sentry, mock_get_user_swap):
+    do_check()
+    data = check_metrics.get('DB_DEFAULT')
+    assert data['statuses']['timeout'] == 1
+    assert data['buckets'][6] == (0.1, 0)
+    assert data['buckets'][7] == (0.25, 1)
+
+
+@pytest.mark.django_db
+def test_stream(client, monkeypatch, mock_sentry, mock_get_user_swap):
+    def slow_run(self):
+        time.sleep(0.2)
+        raise SystemStatusError('BOOM')
+
+    monkeypatch.setattr('service_status.checks.DatabaseCheck._run', slow_run)
+    start = time.time()
+    response = client.get(reverse('service-status:stream'))
+    assert response['Content-Type'] == 'application/x-ndjson'
+    content = iter(response.streaming_content)
+    first = json.loads(next(content))
+    assert time.time() - start < 0.15
+    records = [first] + [json.loads(line) for line in content]
+    assert time.time() - start >= 0.2
+    assert [(record['type'], record.get('name'), record['status']) for record in records] == [
+        ('check', 'SWAP', 'normal'),
+        ('check', 'DB_DEFAULT', 'error'),
+        ('summary', None, 'ERRORS_FOUND'),
+    ]
+    assert records[2]['errors'] == ['BOOM']
+
+
+@pytest.mark.django_db
+def test_stream_sse(client, mock_dbcheck, mock_sentry, mock_get_user_swap):
+    response = client.get(reverse('service-status:stream'), HTTP_ACCEPT='text/event-stream')
+    assert response['Content-Type'] == 'text/event-stream'
+    events = b''.join(response.streaming_content).decode('utf-8').split('\n\n')
+    assert [event.split('\n')[0] for event in events] == ['event: check', 'event: check', 'event: summary', '']
+    assert json.loads(events[2].split('\n')[1][len('data: '):]) == {
+        'status': 'SERVICE_OPERATIONAL', 'errors': [], 'warnings': ['GOSH']}
+
+
+class SleepCheck(SystemCheckBase):
+
+    def __init__(self, delay=0.1, **kwargs):
+        super(SleepCheck, self).__init__(**kwargs)
+        self.delay = delay
+
+    def _run(self):
+        time.sleep(self.delay)
+        return 'slept {}s'.format(self.delay)
+
+
+@pytest.mark.django_db
+def test_depends_on(service_status_settings, app, mock_dbcheck, mock_sentry, mock_get_user_swap):
+    service_status_settings.SERVICE_STATUS_INIT_SWAP = {'depends_on': ['DB_DEFAULT']}
+    status = do_check()
+    assert [check.status for check in status.checks] == ['warning', 'normal']
+
+    mock_dbcheck.side_effect = SystemStatusError('BOOM')
+    response = app.get(reverse('service-status:index'), status=503)
+    assert [li.attrib['class'] for li in response.pyquery('#main li')] == ['error', 'skipped']
+    assert response.pyquery('#main li').eq(1).text() == 'SwapCheck SWAP: skipped: `DB_DEFAULT` failed (0.000s)'
+    assert mock_get_user_swap.call_count == 1
+    assert mock_sentry.error.call_count == 1
+
+    status = do_check()
+    assert [str(e) for e in status.errors] == ['BOOM']
+    assert status.warnings == []
+
+
+@pytest.mark.django_db
+def test_depends_on_concurrent(service_status_settings, mock_dbcheck, mock_sentry, mock_get_user_swap):
+    service_status_settings.SERVICE_STATUS_CONCURRENT = True
+    service_status_settings.SERVICE_STATUS_CHECKS = (
+        ('SLEEP3', 'tests.test_systemstatus.SleepCheck'),
+        ('SLEEP2', 'tests.test_systemstatus.SleepCheck'),
+        ('SLEEP1', 'tests.test_systemstatus.SleepCheck'),
+        ('DB_DEFAULT', 'service_status.checks.DatabaseCheck'),
+        ('SWAP', 'service_status.checks.SwapCheck'),
+    )
+    service_status_settings.SERVICE_STATUS_INIT_SLEEP3 = {'depends_on': ['SLEEP1', 'SLEEP2']}
+    service_status_settings.SERVICE_STATUS_INIT_SLEEP2 = {'depends_on': ['SLEEP1']}
+    service_status_settings.SERVICE_STATUS_INIT_DB_DEFAULT = {'depends_on': ['SLEEP3']}
+    service_status_settings.SERVICE_STATUS_INIT_SWAP = {'depends_on': ['DB_DEFAULT']}
+    mock_dbcheck.side_effect = SystemStatusError('BOOM')
+
+    completed = [check.name for check in iter_checks(get_checks().checks)]
+    assert completed == ['SLEEP1', 'SLEEP2', 'SLEEP3', 'DB_DEFAULT', 'SWAP']
+
+    status = do_check()
+    sleep3, sleep2, sleep1 = status.checks[:3]
+    assert sleep1.completed <= sleep2.started and sleep2.completed <= sleep3.started
+    assert [check.status for check in status.checks] == ['normal', 'normal', 'normal', 'error', 'skipped']
+    assert mock_get_user_swap.call_count == 0
+
+
+@pytest.mark.django_db
+def test_depends_on_transitive(service_status_settings, mock_hanging_dbcheck, mock_sentry, mock_get_user_swap):
+    service_status_settings.SERVICE_STATUS_CHECKS = (
+        ('DB_DEFAULT', 'service_status.checks.DatabaseCheck'),
+        ('SWAP', 'service_status.checks.SwapCheck'),
+        ('SLEEP1', 'tests.test_systemstatus.SleepCheck'),
+    )
+    service_status_settings.SERVICE_STATUS_INIT_DB_DEFAULT = {'timeout': 0.1}
+    service_status_settings.SERVICE_STATUS_INIT_SWAP = {'depends_on': ['DB_DEFAULT']}
+    service_status_settings.SERVICE_STATUS_INIT_SLEEP1 = {'depends_on': ['SWAP']}
+    status = do_check()
+    assert [check.output for check in status.checks] == [
+        'timed out', 'skipped: `DB_DEFAULT` failed', 'skipped: `SWAP` failed']
+    assert len(status.errors) == 1
+
+
+@pytest.mark.django_db
+def test_depends_on_async(settings_async, service_status_settings, mock_dbcheck, mock_sentry, mock_get_user_swap):
+    service_status_settings.SERVICE_STATUS_INIT_SLEEP1 = {'depends_on': ['DB_DEFAULT'], 'delay': 0.05}
+    service_status_settings.SERVICE_STATUS_INIT_SLEEP2 = {'depends_on': ['SLEEP1'], 'delay': 0.05}
+    status = asyncio.run(async_do_check())
+    db_default, sleep1, sleep2, _ = status.checks
+    assert db_default.completed <= sleep1.started and sleep1.completed <= sleep2.started
+    assert [check.status for check in status.checks] == ['warning', 'normal', 'normal', 'normal']
+
+    mock_dbcheck.side_effect = SystemStatusError('BOOM')
+    status = asyncio.run(async_do_check())
+    assert [check.status for check in status.checks] == ['error', 'skipped', 'skipped', 'normal']
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('concurrent', [False, True])
+def test_depends_on_failed_first(service_status_settings, mock_dbcheck, mock_sentry, mock_get_user_swap, concurrent):
+    service_status_settings.SERVICE_STATUS_CHECKS = (
+        ('DB_DEFAULT', 'service_status.checks.DatabaseCheck'),
+        ('SLEEP1', 'tests.test_systemstatus.SleepCheck'),
+        ('SWAP', 'service_status.checks.SwapCheck'),
+    )
+    service_status_settings.SERVICE_STATUS_INIT_SLEEP1 = {'delay': 0.5}
+    service_status_settings.SERVICE_STATUS_INIT_SWAP = {'depends_on': ['DB_DEFAULT', 'SLEEP1']}
+    mock_dbcheck.side_effect = SystemStatusError('BOOM')
+
+    # the failed dependency skips SWAP at once, while SLEEP1 is still running (or waiting to run)
+    start = time.time()
+    completed = []
+    for check in iter_checks(get_checks().checks, concurrent):
+        completed.append((check.name, check.status, time.time() - start))
+    assert [(name, status) for name, status, _ in completed] == [
+        ('DB_DEFAULT', 'error'), ('SWAP', 'skipped'), ('SLEEP1', 'normal')]
+    assert completed[1][2] < 0.2 <= completed[2][2]
+    assert mock_get_user_swap.call_count == 0
+
+
+@pytest.mark.django_db
+def test_depends_on_failed_first_async(settings_async, service_status_settings, mock_dbcheck, mock_sentry,
+                                       mock_get_user_swap):
+    service_status_settings.SERVICE_STATUS_INIT_SLEEP1 = {'delay': 0.5}
+    service_status_settings.SERVICE_STATUS_INIT_SLEEP2 = {'delay': 0.05}
+    service_status_settings.SERVICE_STATUS_INIT_SWAP = {'depends_on': ['DB_DEFAULT', 'SLEEP1']}
+    mock_dbcheck.side_effect = SystemStatusError('BOOM')
+
+    status = asyncio.run(async_do_check())
+    db_default, sleep1, _, swap = status.checks
+    assert [check.status for check in status.checks] == ['error', 'normal', 'normal', 'skipped']
+    assert swap.completed - db_default.completed < 0.2 <= sleep1.completed - swap.completed
+    assert mock_get_user_swap.call_count == 0
+
+
+@pytest.mark.parametrize('init, message', [
+    ({'DB_DEFAULT': {'depends_on': 'SWAP'}}, 'DB_DEFAULT: `depends_on` must be a list'),
+    ({'DB_DEFAULT': {'depends_on': ['CELERY']}}, 'DB_DEFAULT: unknown dependency `CELERY`'),
+    ({'DB_DEFAULT': {'depends_on': ['SWAP']}, 'SWAP': {'depends_on': ['DB_DEFAULT']}},
+     'circular dependency: DB_DEFAULT -> SWAP -> DB_DEFAULT'),
+])
+def test_depends_on_improperly_configured(service_status_settings, init, message):
+    for name, kwargs in init.items():
+        setattr(service_status_settings, 'SERVICE_STATUS_INIT_{}'.format(name), kwargs)
+    with pytest.raises(ImproperlyConfigured) as exception_info:
+        registry.compile()
+    assert str(exception_info.value) == message
+
+
+def test_depends_on_dense(service_status_settings):
+    names = ['CHECK{}'.format(i) for i in range(40)]
+    service_status_settings.SERVICE_STATUS_CHECKS = [(name, 'service_status.checks.SwapCheck') for name in names]
+    for i, name in enumerate(names):
+        setattr(service_status_settings, 'SERVICE_STATUS_INIT_{}'.format(name), {'depends_on': names[:i]})
+    start = time.time()
+    registry.compile()
+    assert time.time() - start < 1
+
+
+@pytest.fixture()
+def settings_databases(service_status_settings):
+    service_status_settings.SERVICE_STATUS_CHECKS = (('DATABASES', 'service_status.checks.DatabasesCheck'),)
+    return service_status_settings
+
+
+@pytest.mark.django_db(databases=['default', 'interface'])
+def test_databases(settings_databases, mock_sentry):
+    status = do_check()
+    assert status.errors == status.warnings == []
+    assert re.match(r'^got response from 2 database\(s\): default \d+ms, interface \d+ms$', status.checks[0].output)
+
+    settings_databases.SERVICE_STATUS_INIT_DATABASES = {'exclude': ['default']}
+    assert re.match(r'^got response from 1 database\(s\): interface \d+ms$', do_check().checks[0].output)
+
+
+@pytest.mark.django_db(databases=['default', 'interface'])
+def test_databases_errors(settings_databases, monkeypatch, mock_sentry):
+    def probe(self, alias):
+        if alias == 'interface':
+            raise Exception('connection refused')
+        return 0.1, None
+
+    monkeypatch.setattr('service_status.checks.DatabasesCheck.probe', probe)
+    settings_databases.SERVICE_STATUS_INIT_DATABASES = {'aliases': ['default', 'interface', 'default']}
+    status = do_check()
+    assert [str(e) for e in status.errors] == ['database(s) `interface`: connection refused']
+
+
+@pytest.mark.django_db(databases=['default', 'interface'])
+def test_databases_replication_lag(settings_databases, monkeypatch, mock_sentry):
+    monkeypatch.setattr('service_status.checks.DatabasesCheck.get_replication_lag',
+                        lambda self, connection: 12.5 if connection.alias == 'interface' else None)
+    assert do_check().checks[0].output.endswith(' (lag: 12.5s)')
+
+    settings_databases.SERVICE_STATUS_INIT_DATABASES = {'max_lag': 10}
+    status = do_check()
+    assert status.checks[0].status == 'warning'
+    assert mock_sentry.warning.call_args[0] == ('replication lag above 10s: `interface` 12.5s',)
+
+
+def mock_connection(vendor, row, columns, errors):
+    connection = mock.MagicMock(vendor=vendor)
+    cursor = connection.cursor.return_value.__enter__.return_value
+
+    def execute(sql):
+        if sql.startswith(errors):
+            raise DatabaseError('permission denied')
+
+    cursor.execute.side_effect = execute
+    cursor.fetchone.return_value = row
+    cursor.description = [(column, None) for column in columns]
+    return connection, cursor
+
+
+@pytest.mark.parametrize('vendor, row, columns, errors, statements, expected', [
+    ('postgresql', (None,), (), (), ['SELECT CASE'], None),
+    ('postgresql', (Decimal('1.5'),), (), (), ['SELECT CASE'], 1.5),
+    ('postgresql', None, (), ('SELECT',), ['SELECT CASE'], None),
+    ('mysql', (1, 3), ('Id', 'Seconds_Behind_Source'), (), ['SHOW REPLICA STATUS'], 3.0),
+    ('mysql', (1, None), ('Id', 'Seconds_Behind_Source'), (), ['SHOW REPLICA STATUS'], None),
+    ('mysql', None, (), (), ['SHOW REPLICA STATUS'], None),
+    # MariaDB
+    ('mysql', (1, 4), ('Id', 'Seconds_Behind_Master'), (), ['SHOW REPLICA STATUS'], 4.0),
+    # before MySQL 8.0.22
+    ('mysql', (1, 5), ('Id', 'Seconds_Behind_Master'), ('SHOW REPLICA',),
+     ['SHOW REPLICA STATUS', 'SHOW SLAVE STATUS'], 5.0),
+    # without the REPLICATION CLIENT privilege
+    ('mysql', None, (), ('SHOW',), ['SHOW REPLICA STATUS', 'SHOW SLAVE STATUS'], None),
+    ('sqlite', None, (), (), [], None),
+])
+def test_databases_get_replication_lag(vendor, row, columns, errors, statements, expected):
+    connection, cursor = mock_connection(vendor, row, columns, errors)
+    assert DatabasesCheck(name='DATABASES').get_replication_lag(connection) == expected
+    executed = [args[0] for args, _ in cursor.execute.call_args_list]
+    assert len(executed) == len(statements)
+    assert all(sql.startswith(statement) for sql, statement in zip(executed, statements))
+
+
+@pytest.fixture()
+def settings_caches(service_status_settings, tmp_path):
+    from django.core.cache import caches
+
+    service_status_settings.CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'service-status-test'},
+        'files': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': str(tmp_path)},
+    }
+    service_status_settings.SERVICE_STATUS_CHECKS = (('CACHES', 'service_status.checks.CacheCheck'),)
+    yield service_status_settings
+    caches['default'].clear()
+
+
+@pytest.mark.django_db
+def test_cache_check(settings_caches, tmp_path, mock_sentry):
+    from django.core.cache import caches
+
+    status = do_check()
+    assert status.errors == status.warnings == []
+    assert re.match(r'^got response from 2 cache\(s\): default \d+ms, files \d+ms$', status.checks[0].output)
+    # the probe keys are deleted
+    assert caches['default']._cache == {}
+    assert list(tmp_path.iterdir()) == []
+
+    settings_caches.SERVICE_STATUS_INIT_CACHES = {'exclude': ['files'], 'max_latency': 0}
+    status = do_check()
+    assert status.checks[0].status == 'warning'
+    assert re.match(r'^cache latency above 0s: `default` \d+ms$', mock_sentry.warning.call_args[0][0])
+
+
+@pytest.mark.django_db
+def test_cache_check_lost_keys(settings_caches, mock_sentry):
+    settings_caches.CACHES = dict(settings_caches.CACHES, dummy={
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache'})
+    status = do_check()
+    assert [str(e) for e in status.errors] == ['cache(s) `dummy`: read 0 of the 2 keys written']
+
+
+@pytest.fixture()
+def settings_http(service_status_settings, http_server):
+    url = 'http://127.0.0.1:{}'.format(http_server.server_port)
+    service_status_settings.SERVICE_STATUS_CHECKS = (('HTTP', 'service_status.checks.HttpCheck'),)
+    service_status_settings.SERVICE_STATUS_INIT_HTTP = {'urls': [url + '/ok']}
+    return service_status_settings, url
+
+
+@pytest.mark.django_db
+def test_http(settings_http, http_server, mock_sentry):
+    settings, url = settings_http
+    status = do_check()
+    assert status.errors == []
+    assert re.match(r'^got response from 1 url\(s\): http://127.0.0.1:\d+/ok \d+ms$', status.checks[0].output)
+
+    # the connection is kept alive
+    do_check()
+    assert len(http_server.connections) == 1
+
+    settings.SERVICE_STATUS_INIT_HTTP = {'urls': [
+        url + '/ok',
+        {'url': url + '/fail', 'status': 500, 'match': '^pong$'},
+        {'url': url + '/ok', 'match': 'ping'},
+        {'url': url + '/fail'},
+    ]}
+    status = do_check()
+    assert [str(e) for e in status.errors] == [
+        'url(s) `{0}/ok`: the response does not match `ping`; `{0}/fail`: status 500 (expected 200)'.format(url)]
+
+
+@pytest.mark.django_db
+def test_http_timeout(settings_http, http_server, mock_sentry):
+    settings, url = settings_http
+    settings.SERVICE_STATUS_INIT_HTTP = {'urls': [
+        url + '/slow',
+        {'url': url + '/slow', 'timeout': 0.1},
+    ]}
+    status = do_check()
+    assert [str(e) for e in status.errors] == ['url(s) `{}/slow`: timed out'.format(url)]
+
+
+@pytest.mark.django_db
+def test_http_reconnect(settings_http, http_server, mock_sentry):
+    from service_status.checks import http_pool
+
+    do_check()
+    # the server closed the idle connection
+    for idle in http_pool._idle.values():
+        for connection in idle:
+            connection.sock.shutdown(socket.SHUT_RDWR)
+    assert do_check().errors == []
+    assert len(http_server.connections) == 2
+
+
+@pytest.mark.django_db
+def test_http_after_fork(settings_http, http_server, mock_sentry):
+    do_check()
+    assert len(http_server.connections) == 1
+
+    # a forked process does not reuse the connections of its parent
+    with mock.patch('os.getpid', return_value=-1):
+        assert do_check().errors == []
+        assert len(http_server.connections) == 2
+        assert do_check().errors == []
+        assert len(http_server.connections) == 2
+
+
+@pytest.mark.parametrize('url, message', [
+    ({'status': 200}, 'HTTP: every target of HttpCheck needs an `url`'),
+    ('auth.internal/health', 'HTTP: `auth.internal/health` is not an absolute http(s) URL'),
+    ('ftp://auth.internal/health', 'HTTP: `ftp://auth.internal/health` is not an absolute http(s) URL'),
+    ('http:///health', 'HTTP: `http:///health` is not an absolute http(s) URL'),
+])
+def test_http_improperly_configured(settings_http, url, message):
+    settings, _ = settings_http
+    settings.SERVICE_STATUS_INIT_HTTP = {'urls': [url]}
+    with pytest.raises(ImproperlyConfigured) as exception_info:
+        registry.compile()
+    assert str(exception_info.value) == message
+
+
+def call_service_status(*args):
+    stdout = six.StringIO()
+    with pytest.raises(SystemExit) as exit_info:
+        call_command('service_status', *args, stdout=stdout)
+    return exit_info.value.code, stdout.getvalue()
+
+
+@pytest.mark.django_db
+def test_command(mock_dbcheck, mock_time, mock_sentry, mock_get_user_swap):
+    assert call_service_status() == (1, '''\
+SERVICE_OPERATIONAL
+DatabaseCheck DB_DEFAULT: GOSH (7.000s)
+SwapCheck SWAP: the user swap memory is: 0 KB (limit: 0 KB) (7.000s)
+''')
+
+    mock_dbcheck.side_effect = None
+    mock_dbcheck.return_value = 'DB OK'
+    exit_code, output = call_service_status('--format', 'json')
+    assert exit_code == 0
+    assert json.loads(output)['status'] == 'SERVICE_OPERATIONAL'
+
+    mock_dbcheck.side_effect = SystemStatusError('BOOM')
+    exit_code, output = call_service_status('--format', 'prom')
+    assert exit_code == 2
+    assert 'service_status_up 0.0' in output.splitlines()
+
+
+@pytest.mark.django_db
+def test_command_options(service_status_settings, mock_hanging_dbcheck, mock_sentry, mock_get_user_swap):
+    service_status_settings.SERVICE_STATUS_PROFILES = {'swap': ['SWAP']}
+    assert call_service_status('--profile', 'swap')[0] == 0
+    assert mock_hanging_dbcheck.call_count == 0
+
+    start = time.time()
+    receiver = mock.Mock()
+    setting_changed.connect(receiver)
+    try:
+        exit_code, output = call_service_status('--parallel', '2', '--timeout', '0.1')
+    finally:
+        setting_changed.disconnect(receiver)
+    assert time.time() - start < 1
+    assert exit_code == 2
+    assert 'DatabaseCheck DB_DEFAULT: timed out' in output
+    assert conf.DEADLINE is None
+    # the settings are not overridden, which would clear the cached results, the breakers and the registry
+    assert receiver.call_count == 0
+
+    with pytest.raises(CommandError) as exception_info:
+        call_command('service_status', '--profile', 'unknown')
+    assert exception_info.value.returncode == 2
+
+    for parallel in ('0', '-1'):
+        with pytest.raises(CommandError, match='argument --parallel: must be at least 1'):
+            call_command('service_status', '--parallel', parallel)
+
+
+@pytest.mark.django_db
+def test_command_watch(monkeypatch, mock_dbcheck, mock_sentry, mock_get_user_swap):
+    sleep = mock.Mock(side_effect=[None, KeyboardInterrupt])
+    monkeypatch.setattr('service_status.management.commands.service_status.time.sleep', sleep)
+    exit_code, output = call_service_status('--watch', '5')
+    assert exit_code == 1
+    assert sleep.call_args_list == [mock.call(5.0), mock.call(5.0)]
+    assert output.count('SERVICE_OPERATIONAL') == 2
+
+
+def wait_for(condition, timeout=2):
+    start = time.time()
+    while not condition() and time.time() - start < timeout:
+        time.sleep(0.01)
+    return condition()
+
+
+@pytest.mark.django_db
+def test_scheduler(settings_scheduler, app, mock_dbcheck, mock_sentry, mock_get_user_swap):
+    scheduler = settings_scheduler
+    mock_dbcheck.side_effect = None
+    mock_dbcheck.return_value = 'DB OK'
+    url = reverse('service-status:index')
+    response = app.get(url, status=503)
+    assert response.pyquery('#main li').eq(0).text() == 'DatabaseCheck DB_DEFAULT: waiting for the first run (0.000s)'
+
+    assert wait_for(lambda: mock_get_user_swap.call_count >= 3)
+    assert mock_dbcheck.call_count >= 3
+
+    calls = mock_dbcheck.call_count
+    response = app.get(url)
+    assert mock_dbcheck.call_count - calls <= 1
+    assert [li.attrib['class'] for li in response.pyquery('#main li')] == ['normal', 'normal']
+    assert response.pyquery('#main li').eq(0).text().startswith('DatabaseCheck DB_DEFAULT: DB OK')
+
+    scheduler.stop()
+    assert not scheduler.running
+
+
+@pytest.mark.django_db
+def test_scheduler_after_fork(settings_scheduler, mock_dbcheck, mock_sentry, mock_get_user_swap):
+    scheduler = settings_scheduler
+    scheduler.start()
+    assert wait_for(lambda: len(scheduler._results) == 2)
+    thread, stop = scheduler._thread, scheduler._stop
+
+    with mock.patch('os.getpid', return_value=-1):
+        scheduler._after_fork()
+        assert not scheduler.running
+        status = scheduler.snapshot()
+        assert scheduler.running
+        scheduler.stop()
+    assert scheduler._thread is not thread
+    assert [check.status for check in status.checks] == ['warning', 'normal']
+
+    # in a real fork the thread of the parent process does not exist in the child
+    stop.set()
+    thread.join()
+
+
+@pytest.mark.django_db
+def test_scheduler_run_forever(settings_scheduler, mock_dbcheck, mock_sentry, mock_get_user_swap):
+    scheduler = settings_scheduler
+    scheduler.start()
+    thread = scheduler._thread
+    runner = threading.Thread(target=scheduler.run_forever)
+    runner.start()
+    # the background thread is replaced, not doubled
+    assert wait_for(lambda: not thread.is_alive())
+    assert scheduler._thread is runner
+    scheduler.start()
+    assert scheduler._thread is runner
+
+    scheduler.stop()
+    runner.join(2)
+    assert not runner.is_alive()
+
+
+def test_scheduler_command(settings, settings_shared_cache):
+    out = six.StringIO()
+    with mock.patch('service_status.scheduler.scheduler.run_forever', side_effect=KeyboardInterrupt) as run_forever:
+        call_command('service_status_scheduler', stdout=out)
+    assert run_forever.call_count == 1
+    assert out.getvalue() == 'Running the service status scheduler, press CTRL-C to stop.\n'
+
+    settings.SERVICE_STATUS_CACHE_TTL = 0
+    with pytest.raises(CommandError, match='No check has a cache_ttl'):
+        call_command('service_status_scheduler')
+
+    settings.SERVICE_STATUS_SHARED_CACHE = None
+    with pytest.raises(CommandError, match='SERVICE_STATUS_SHARED_CACHE is not set'):
+        call_command('service_status_scheduler')
+
+
+@pytest.mark.django_db(databases=['default', 'interface'])
+@pytest.mark.parametrize('init_kwargs, expected', [
+    ({'mode': 'ping'}, 'SELECT 1 (db: default) OK'),
+    ({'mode': 'ping', 'database_alias': 'interface'}, 'SELECT 1 (db: interface) OK'),
+    ({'mode': 'exists', 'model_name': 'auth.group'}, 'auth.group (db: default) OK'),
+    ({'mode': 'count', 'statement_timeout': 0.5}, 'sessions.Session (db: default) 0 OK'),
+])
+def test_database_modes(init_kwargs, expected, mock_sentry):
+    check = DatabaseCheck(name='DB', **init_kwargs)
+    check.run()
+    assert check.output == expected
+    assert check.status == 'normal'
+
+
+def test_database_invalid_mode():
+    with pytest.raises(ImproperlyConfigured):
+        DatabaseCheck(name='DB', mode='select')
+
+
+def test_database_statement_timeout():
+    check = DatabaseCheck(name='DB', statement_timeout=1.5)
+    connection = mock.Mock(vendor='postgresql')
+    assert check.get_statement_timeout_sql(connection) == ('SET LOCAL statement_timeout = 1500', None)
+    assert check.get_statement_timeout_sql(mock.Mock(vendor='mysql', mysql_is_mariadb=False)) == (
+        'SET SESSION max_execution_time = 1500', 'SET SESSION max_execution_time = DEFAULT')
+    assert check.get_statement_timeout_sql(mock.Mock(vendor='mysql', mysql_is_mariadb=True)) == (
+        'SET SESSION max_statement_time = 1.500', 'SET SESSION max_statement_time = DEFAULT')
+    assert check.get_statement_timeout_sql(connections['default']) is None
+    assert DatabaseCheck(name='DB').get_statement_timeout_sql(connection) is None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_database_statement_timeout_atomic_requests(monkeypatch, mock_sentry):
+    from django.db import transaction
+    from django.test.utils import CaptureQueriesContext
+
+    monkeypatch.setattr('service_status.checks.DatabaseCheck.get_statement_timeout_sql',
+                        lambda self, connection: ('SELECT 1', 'SELECT 2'))
+    check = DatabaseCheck(name='DB', mode='ping', statement_timeout=1)
+    with transaction.atomic():
+        with CaptureQueriesContext(connections['default']) as context:
+            check.run()
+    assert check.status == 'normal'
+    # the timeout is reset and the savepoint rolled back, not left in force for the rest of the request
+    queries = [query['sql'] for query in context.captured_queries]
+    assert queries[1:4] == ['SELECT 1', 'SELECT 1', 'SELECT 2']
+    assert queries[4].startswith('ROLLBACK TO SAVEPOINT')
+
+
+@pytest.mark.django_db
+def test_celery_partial(settings_celery, monkeypatch, mock_sentry):
+    monkeypatch.setattr(dummy_celery_app.control, 'response', 'pong')
+    monkeypatch.setattr(dummy_celery_app.control, 'hostnames', {'foo'})
+    ping = mock.Mock(wraps=dummy_celery_app.control.ping)
+    monkeypatch.setattr(dummy_celery_app.control, 'ping', ping)
+
+    status = do_check()
+    check = status.checks[0]
+    assert check.output == 'celery worker(s) `bar`, `baz` not found'
+    assert list(check.latencies) == ['foo']
+    ping.assert_called_once_with(destination=['foo', 'bar', 'baz'], timeout=1.0, limit=3, callback=mock.ANY)
+
+
+@pytest.mark.django_db
+def test_celery_timeout(settings_celery, settings, monkeypatch, mock_sentry):
+    monkeypatch.setattr(dummy_celery_app.control, 'response', 'pong')
+    monkeypatch.setattr(dummy_celery_app.control, 'delay', 0.05)
+
+    status = do_check()
+    assert status.checks[0].status == 'normal'
+    assert 40 < status.checks[0].latencies['foo'] * 1000 < 500
+
+    monkeypatch.setattr(dummy_celery_app.control, 'delay', 2)
+    settings.SERVICE_STATUS_INIT_CELERY = dict(settings.SERVICE_STATUS_INIT_CELERY, timeout=0.2)
+    status = do_check()
+    assert status.checks[0].elapsed < 0.2
+    assert status.checks[0].output == 'celery worker(s) `foo`, `bar`, `baz` not found'
+
+
+@mock.patch('service_status.checks.redis', create=True)
+@pytest.mark.django_db
+def test_redis_pooled_client(redis_mock, settings_redis, settings):
+    settings.SERVICE_STATUS_INIT_REDIS = {
+        'redis_url': 'redis://redis.example.com:16379/2',
+        'info_fields': ['redis_version', 'connected_clients'],
+    }
+    client = redis_mock.StrictRedis.from_url.return_value
+    client.pipeline.return_value.execute.return_value = [True, {'redis_version': '7.0.0', 'connected_clients': 3}]
+
+    for _ in range(3):
+        status = do_check()
+    assert status.checks[0].output == 'active (redis_version: 7.0.0, connected_clients: 3)'
+    redis_mock.StrictRedis.from_url.assert_called_once_with('redis://redis.example.com:16379/2', socket_timeout=0.1,
+                                                            socket_connect_timeout=0.1)
+    assert client.pipeline.call_count == 3
+    assert client.ping.call_count == 0
+
+
+@pytest.mark.django_db
+def test_registry(service_status_settings, monkeypatch, mock_sentry, mock_get_user_swap):
+    from service_status.checks import import_string
+
+    _import_string = mock.Mock(wraps=import_string)
+    monkeypatch.setattr('service_status.checks.import_string', _import_string)
+    registry.invalidate()
+
+    first = do_check()
+    second = do_check()
+    assert _import_string.call_count == 2
+    assert [check.name for check in second.checks] == ['DB_DEFAULT', 'SWAP']
+    assert first.checks[0] is not second.checks[0]
+    assert first.checks[0] not in registry.get_plan().checks
+    assert registry.get_plan().checks[0].output is None
+
+    service_status_settings.SERVICE_STATUS_INIT_SWAP = {'limit': 1024}
+    assert do_check().checks[1].limit == 1024
+    assert _import_string.call_count == 4
+
+
+class CounterCheck(SystemCheckBase):
+
+    def __init__(self, **kwargs):
+        super(CounterCheck, self).__init__(**kwargs)
+        self.runs = []
+
+    def _run(self):
+        self.runs.append(self.name)
+        return 'run {} time(s)'.format(len(self.runs))
+
+
+@pytest.mark.django_db
+def test_registry_no_shared_state(service_status_settings, mock_sentry):
+    service_status_settings.SERVICE_STATUS_CHECKS = (('COUNTER', 'tests.test_systemstatus.CounterCheck'),)
+    assert do_check().checks[0].output == 'run 1 time(s)'
+    assert do_check().checks[0].output == 'run 1 time(s)'
+    assert registry.get_plan().checks[0].runs == []
+
+
+@pytest.mark.parametrize('checks, init, message', [
+    ((('FOO', 'service_status.checks.FooCheck'),), {}, 'FOO: cannot import `service_status.checks.FooCheck`'),
+    ((('SWAP', 'service_status.checks.SwapCheck'),), ['limit'], 'SWAP: SERVICE_STATUS_INIT_SWAP must be a dict'),
+    ((('SWAP', 'service_status.checks.SwapCheck'),), {'tags': 'live'}, 'SWAP: `tags` must be a list'),
+])
+def test_registry_improperly_configured(service_status_settings, checks, init, message):
+    service_status_settings.SERVICE_STATUS_CHECKS = checks
+    service_status_settings.SERVICE_STATUS_INIT_SWAP = init
+    with pytest.raises(ImproperlyConfigured) as exception_info:
+        registry.compile()
+    assert str(exception_info.value).startswith(message)
+
+
+@pytest.mark.parametrize('profiles, message', [
+    (['live'], 'SERVICE_STATUS_PROFILES must be a dict'),
+    ({'live': 'live'}, 'SERVICE_STATUS_PROFILES: `live` must be a list of tags'),
+])
+def test_profiles_improperly_configured(service_status_settings, profiles, message):
+    service_status_settings.SERVICE_STATUS_PROFILES = profiles
+    with pytest.raises(ImproperlyConfigured) as exception_info:
+        registry.compile()
+    assert str(exception_info.value) == message
+
+
+@pytest.mark.django_db
+def test_profiles(service_status_settings, app, mock_dbcheck, mock_sentry, mock_get_user_swap):
+    service_status_settings.SERVICE_STATUS_PROFILES = {'live': [], 'ready': ['ready'], 'deep': ['ready', 'SWAP']}
+    service_status_settings.SERVICE_STATUS_INIT_DB_DEFAULT = {'tags': ['ready']}
+
+    response = app.get(reverse('service-status:profile', kwargs={'profile': 'live'}))
+    assert response.pyquery('#main li').length == 0
+    assert mock_dbcheck.call_count == mock_get_user_swap.call_count == 0
+
+    response = app.get(reverse('service-status:profile', kwargs={'profile': 'ready'}))
+    assert [li.text for li in response.pyquery('#main li')] == ['DatabaseCheck DB_DEFAULT: GOSH (0.000s)']
+    assert mock_get_user_swap.call_count == 0
+
+    response = app.get(reverse('service-status:json'), {'profile': 'deep'})
+    assert [check['name'] for check in response.json['checks']] == ['DB_DEFAULT', 'SWAP']
+    assert [check.name for check in do_check().checks] == ['DB_DEFAULT', 'SWAP']
+    assert mock_get_user_swap.call_count == 2
+
+    app.get(reverse('service-status:profile', kwargs={'profile': 'unknown'}), status=404)
+    app.get(reverse('service-status:metrics'), {'profile': 'unknown'}, status=404)
+
+
+class BrokenCheck(SystemCheckBase):
+
+    def __init__(self, **kwargs):
+        raise SystemStatusError('broken')
+
+
+@pytest.mark.django_db
+def test_profiles_construction_errors(service_status_settings, mock_sentry, mock_get_user_swap):
+    service_status_settings.SERVICE_STATUS_CHECKS = (
+        ('BROKEN', 'tests.test_systemstatus.BrokenCheck'),
+        ('SWAP', 'service_status.checks.SwapCheck'),
+    )
+    service_status_settings.SERVICE_STATUS_INIT_BROKEN = {'tags': ['live']}
+    service_status_settings.SERVICE_STATUS_PROFILES = {'live': ['live'], 'swap': ['SWAP']}
+    status = do_check(profile='live')
+    assert (status.checks, [str(e) for e in status.errors]) == ([], ['broken'])
+    status = do_check(profile='swap')
+    assert ([check.name for check in status.checks], status.errors) == (['SWAP'], [])
+
+
+class AsyncSleepCheck(SystemCheckBase):
+    delay = 0.2
+
+    def __init__(self, **kwargs):
+        super(AsyncSleepCheck, self).__init__(**kwargs)
+        if 'delay' in kwargs:
+            self.delay = kwargs['delay']
+
+    async def _arun(self):
+        await asyncio.sleep(self.delay)
+        return 'slept {}s'.format(self.delay)
+
+
+@pytest.mark.django_db
+def test_async_do_check(settings_async, monkeypatch, mock_sentry, mock_get_user_swap):
+    def slow_run(self):
+        time.sleep(0.2)
+        return 'DB OK'
+
+    monkeypatch.setattr('service_status.checks.DatabaseCheck._run', slow_run)
+    start = time.time()
+    status = asyncio.run(async_do_check())
+    assert time.time() - start < 0.4
+    assert [check.output for check in status.checks] == [
+        'DB OK', 'slept 0.2s', 'slept 0.2s', 'the user swap memory is: 0 KB (limit: 0 KB)']
+    assert status.errors == status.warnings == []
+
+
+@pytest.mark.django_db
+def test_async_timeout(settings_async, settings_deadline, service_status_settings, mock_sentry, mock_get_user_swap):
+    service_status_settings.SERVICE_STATUS_INIT_SLEEP1 = {'timeout': 0.05}
+    service_status_settings.SERVICE_STATUS_INIT_SLEEP2 = {'delay': 1}
+    status = asyncio.run(async_do_check())
+    assert [check.status for check in status.checks] == ['normal', 'timeout', 'timeout', 'normal']
+    assert [check.output for check in status.checks][1:3] == ['timed out', 'timed out']
+    assert 0.02 <= status.checks[1].elapsed < 0.15
+    assert 0.15 <= status.checks[2].elapsed < 0.5
+
+
+@pytest.mark.django_db
+def test_async_view(settings_async, mock_sentry, mock_get_user_swap):
+    url = reverse('service-status:async')
+    response = asyncio.run(AsyncClient().get(url))
+    assert response.status_code == 200
+    assert 'no-cache' in response['Cache-Control']
+    assert b'SERVICE_OPERATIONAL' in response.content
+    assert response.content.count(b'slept 0.2s') == 2
+
+
+@mock.patch('service_status.checks.aioredis', create=True)
+def test_redis_async(aioredis_mock, mock_sentry):
+    from service_status.checks import async_redis_clients
+
+    client = aioredis_mock.StrictRedis.from_url.return_value
+    client.ping = mock.AsyncMock(return_value=True)
+
+    async def run_twice():
+        for _ in range(2):
+            check = RedisCheck(name='REDIS', redis_url='redis://localhost:6379/0')
+            await check.arun()
+        return check
+
+    check = asyncio.run(run_twice())
+    assert check.output == 'active'
+    assert aioredis_mock.StrictRedis.from_url.call_count == 1
+    assert client.ping.await_count == 2
+    assert len(async_redis_clients) == 0
+
+
+@pytest.mark.django_db
+def test_coalesce(mock_dbcheck, mock_sentry, mock_get_user_swap):
+    mock_dbcheck.side_effect = lambda: time.sleep(0.2)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(do_check())) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert mock_dbcheck.call_count == 1
+    assert mock_get_user_swap.call_count == 1
+    assert len(results) == 5 and all(status is results[0] for status in results)
+
+    do_check()
+    assert mock_dbcheck.call_count == 2
+
+
+@pytest.mark.django_db
+def test_coalesce_disabled(service_status_settings, mock_dbcheck, mock_sentry, mock_get_user_swap):
+    service_status_settings.SERVICE_STATUS_COALESCE = False
+    mock_dbcheck.side_effect = lambda: time.sleep(0.1)
+
+    threads = [threading.Thread(target=do_check) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert mock_dbcheck.call_count == 3
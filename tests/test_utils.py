@@ -1,10 +1,17 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, print_function, unicode_literals
 
+import asyncio
+import os
+import threading
+import time
+
 import pytest
+from django.test import override_settings
 
+import service_status.utils
 from service_status.config import conf
-from service_status.utils import get_user_swap
+from service_status.utils import GetTime, SingleFlight, fan_out, get_user_swap
 
 
 class Test_AppSettings():
@@ -15,6 +22,99 @@ class Test_AppSettings():
         settings.SERVICE_STATUS_FOO = 'BAR'
         assert conf.FOO == 'BAR'
 
+    def test__handler_restore(self):
+        with override_settings(SERVICE_STATUS_FOO='BAR', SERVICE_STATUS_DEADLINE=5):
+            assert (conf.FOO, conf.DEADLINE) == ('BAR', 5)
+        assert not hasattr(conf, 'FOO')
+        assert conf.DEADLINE is None
+
+
+class Test_GetTime():
+    def test_elapsed(self):
+        with GetTime() as timing:
+            sum(range(100000))
+        assert 0 < timing.elapsed < 1
+        assert 0 < timing.cpu_elapsed < 1
+        assert isinstance(timing.t1, int)
+
+    def test_sleep(self):
+        with GetTime('sleep') as timing:
+            time.sleep(0.05)
+        assert timing.name == 'sleep'
+        assert timing.elapsed >= 0.05
+        assert timing.cpu_elapsed < 0.05
+
+
+class Test_SingleFlight():
+    def test_do(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        def func(value):
+            calls.append(value)
+            time.sleep(0.1)
+            return object()
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(single_flight.do('key', func, 1)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert calls == [1]
+        assert len(results) == 5 and len(set(map(id, results))) == 1
+
+        assert single_flight.do('key', func, 2) is not results[0]
+        assert calls == [1, 2]
+
+    def test_do_exception(self):
+        single_flight = SingleFlight()
+        with pytest.raises(ValueError):
+            single_flight.do('key', int, 'foo')
+        assert single_flight.do('key', int, '1') == 1
+
+    def test_ado(self):
+        single_flight = SingleFlight()
+        calls = []
+
+        async def func():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return object()
+
+        async def main():
+            return await asyncio.gather(*[single_flight.ado('key', func) for _ in range(5)])
+
+        results = asyncio.run(main())
+        assert calls == [1]
+        assert len(set(map(id, results))) == 1
+        assert single_flight._tasks == {}
+
+
+class Test_fan_out():
+    def test_fan_out(self):
+        threads = []
+
+        def func(value):
+            time.sleep(0.1)
+            if value == 2:
+                raise ValueError(value)
+            return value * 10
+
+        start = time.time()
+        results = fan_out(func, [1, 2, 3], cleanup=lambda: threads.append(threading.current_thread()))
+        assert time.time() - start < 0.2
+        assert [(item, result) for item, result, _ in results] == [(1, 10), (2, None), (3, 30)]
+        assert [type(e) for _, _, e in results] == [type(None), ValueError, type(None)]
+        assert len(set(threads)) == 3 and threading.current_thread() not in threads
+
+    def test_fan_out_single(self):
+        cleanup = []
+        assert fan_out(str, [1], cleanup=lambda: cleanup.append(1)) == [(1, '1', None)]
+        assert fan_out(str, []) == []
+        assert cleanup == []
+
 
 class Test_get_user_swap():
     def test_no_processes(self, mock_psutil_process_iter):
@@ -24,15 +124,29 @@ class Test_get_user_swap():
     def test_processes1(self, mock_psutil_process_iter, mock_process1):
         mock_psutil_process_iter.return_value = [mock_process1]
         assert get_user_swap() == 10
-        assert mock_psutil_process_iter.call_count == 1
-        assert mock_process1.uids.call_count == 1
+        mock_psutil_process_iter.assert_called_once_with(attrs=['uids'])
         assert mock_process1.memory_full_info.call_count == 1
 
-    def test_processes2(self, mock_psutil_process_iter, mock_process1, mock_process2):
-        mock_psutil_process_iter.return_value = [mock_process1, mock_process2]
+    def test_processes2(self, mock_psutil_process_iter, mock_process1, mock_process2, mock_process3):
+        mock_psutil_process_iter.return_value = [mock_process1, mock_process2, mock_process3]
         assert get_user_swap() == 10
         assert mock_psutil_process_iter.call_count == 1
-        assert mock_process1.uids.call_count == 1
         assert mock_process1.memory_full_info.call_count == 1
-        assert mock_process2.uids.call_count == 1
         assert mock_process2.memory_full_info.call_count == 1
+        assert mock_process3.memory_full_info.call_count == 0
+
+    def test_proc(self, mock_proc, mock_psutil_process_iter):
+        mock_proc('1', 0, 100)
+        mock_proc('2', os.getuid() + 1, 200)
+        mock_proc('3', os.getuid(), 5)
+        mock_proc('4', os.getuid())
+        mock_proc('5', os.getuid(), 7)
+        os.makedirs(os.path.join(service_status.utils.PROC_PATH, 'sys'))
+        assert get_user_swap() == 12 * 1024 + (100 * 1024 if os.getuid() == 0 else 0)
+        assert mock_psutil_process_iter.call_count == 0
+
+    def test_proc_without_swap(self, mock_proc, mock_psutil_process_iter):
+        with open(os.path.join(service_status.utils.PROC_PATH, 'self', 'status'), 'w') as f:
+            f.write('Name:\tfoo\n')
+        assert get_user_swap() == 0
+        assert mock_psutil_process_iter.call_count == 1